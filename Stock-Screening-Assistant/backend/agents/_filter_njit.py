@@ -0,0 +1,52 @@
+"""
+Numba kernel for FilterProcessor
+
+Fused filter + sort pass over a SectorFrame matrix. numba is optional: without it
+`njit` is None and FilterProcessor uses NumPy masks instead.
+"""
+
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+# Filter op codes shared with data_processor
+OP_LT, OP_GT, OP_EQ, OP_PRESENT = 0, 1, 2, 3
+
+def filter_sort_kernel(matrix, col_idx, ops, thresholds, sort_row, descending):
+    """Single pass over the stocks: keep those passing every filter, then stable-sort them by `sort_row`.
+
+    No fastmath here: it would let LLVM assume there are no NaNs, and NaN must fail every filter.
+    """
+    n = matrix.shape[1]
+    survivors = np.empty(n, dtype=np.int64)
+    count = 0
+    for i in range(n):
+        keep = True
+        for j in range(col_idx.shape[0]):
+            val = matrix[col_idx[j], i]
+            op = ops[j]
+            if np.isnan(val) or (op == OP_LT and not val < thresholds[j]) \
+                    or (op == OP_GT and not val > thresholds[j]) or (op == OP_EQ and val != thresholds[j]):
+                keep = False
+                break
+        if keep:
+            survivors[count] = i
+            count += 1
+    survivors = survivors[:count]
+
+    keys = np.empty(count, dtype=np.float64)
+    for k in range(count):
+        val = matrix[sort_row, survivors[k]]
+        val = 0.0 if np.isnan(val) else val  # missing values sort as 0
+        keys[k] = -val if descending else val
+    return survivors[np.argsort(keys, kind='mergesort')]
+
+if njit is not None:
+    # nogil: concurrent requests filtering on worker threads run the kernel in parallel
+    filter_sort_kernel = njit(cache=True, nogil=True)(filter_sort_kernel)
+    # Compile now so the first user query does not pay the JIT cost
+    filter_sort_kernel(np.zeros((1, 1)), np.zeros(1, dtype=np.int64), np.zeros(1, dtype=np.int64),
+                       np.zeros(1), 0, False)
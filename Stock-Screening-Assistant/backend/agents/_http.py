@@ -0,0 +1,42 @@
+"""
+Shared HTTP clients for the OpenAI-backed agents.
+
+Every ChatOpenAI client is handed the same pooled, keep-alive connections,
+so TCP/TLS handshakes are paid once per process rather than once per client.
+HTTP/2 is used when the optional h2 package is installed.
+"""
+
+import logging
+from functools import lru_cache
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+try:
+    import h2  # noqa: F401
+    HTTP2 = True
+except ImportError:  # HTTP/1.1 keep-alive only
+    HTTP2 = False
+
+LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20)
+TIMEOUT = httpx.Timeout(30.0)
+
+
+@lru_cache(maxsize=1)
+def get_http_client() -> httpx.Client:
+    return httpx.Client(http2=HTTP2, limits=LIMITS, timeout=TIMEOUT)
+
+
+@lru_cache(maxsize=1)
+def get_async_http_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(http2=HTTP2, limits=LIMITS, timeout=TIMEOUT)
+
+
+async def prewarm(url: str) -> None:
+    """Open a pooled keep-alive connection to `url`'s host, so the first real call skips the TCP/TLS handshake."""
+    try:
+        # Any response (even 401) leaves the connection in the pool
+        await get_async_http_client().get(url, timeout=5.0)
+    except httpx.HTTPError as e:
+        logger.warning("Connection prewarm to %s failed: %s", url, e)
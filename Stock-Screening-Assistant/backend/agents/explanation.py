@@ -1,96 +1,242 @@
+from ..config import settings
+from ._http import get_async_http_client, get_http_client
 from .base import BaseAgent
 from langchain_openai import ChatOpenAI
 from langchain.prompts import PromptTemplate
-from dotenv import load_dotenv
-import os
+import asyncio
 import time
 import logging
-from typing import Dict, Any
+import threading
+from functools import lru_cache
+from collections import OrderedDict
+from typing import Dict, Any, AsyncIterator, Iterator, Optional, Tuple
 
-# Load environment variables
-dotenv_path = os.path.join(os.path.dirname(__file__), "..", ".env")
-load_dotenv(dotenv_path)
-
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-MODEL_NAME = os.getenv("MODEL_NAME")
+OPENAI_API_KEY = settings.openai_api_key
+MODEL_NAME = settings.model_name
 logger = logging.getLogger(__name__)
-logging.basicConfig(level=logging.INFO, format='%(levelname)s - %(message)s')
+
+class ExplanationError(Exception):
+    """The LLM call for an explanation failed. The message is fit to show the user."""
+
+
+# Identity fields, not metrics, so left out of the LLM context
+_SKIP = frozenset({"symbol", "name", "sector"})
+
+def _fmt(v: Any) -> Any:
+    return f"{v:.2f}" if type(v) is float else v
+
+# Built once at import and shared by every ExplanationAgent
+EXPLANATION_PROMPT = PromptTemplate(
+    input_variables=["input", "stocks", "sector_context"],
+    template="""
+        You are a financial assistant.
+        The user asked: {input}
+
+        The sector-level context is: {sector_context}
+
+        The following stocks were selected: {stocks}
+
+        Explain clearly and concisely why each stock fits what user asked for.
+    """
+)
+
+
+@lru_cache(maxsize=4)
+def _get_llm(model_name: str) -> ChatOpenAI:
+    """One streaming ChatOpenAI client per model, on the process-wide HTTP connection pool."""
+    return ChatOpenAI(
+        model=model_name,
+        temperature=0.3,
+        api_key=OPENAI_API_KEY,
+        streaming=True,
+        http_client=get_http_client(),
+        http_async_client=get_async_http_client(),
+    )
 
 class ExplanationAgent(BaseAgent):
-    def __init__(self):
-        prompt = PromptTemplate(
-            input_variables=["input", "stocks", "sector_context"],
-            template="""
-                You are a financial assistant.
-                The user asked: {input}
+    CACHE_SIZE = 256  # explanations kept in memory
 
-                The sector-level context is: {sector_context}
+    def __init__(self, model_name: str = MODEL_NAME):
+        self.chain = EXPLANATION_PROMPT | _get_llm(model_name)
+        # Explanations keyed by the formatted chain inputs, so a repeated query over the same stocks skips the LLM
+        self._cache: "OrderedDict[Tuple[str, str, str], str]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        # LLM calls in flight in ainvoke(), so concurrent identical requests wait on one call instead of each making their own
+        self._inflight: Dict[Tuple[str, str, str], "asyncio.Task"] = {}
 
-                The following stocks were selected: {stocks}
+    @staticmethod
+    def _cache_key(chain_inputs: Dict[str, str]) -> Tuple[str, str, str]:
+        return chain_inputs["input"].strip().lower(), chain_inputs["stocks"], chain_inputs["sector_context"]
 
-                Explain clearly and concisely why each stock fits what user asked for.
-            """
-        )
+    def _cache_get(self, key: Tuple[str, str, str]) -> Optional[str]:
+        with self._cache_lock:
+            content = self._cache.get(key)
+            if content is not None:
+                self._cache.move_to_end(key)
+            return content
 
-        llm = ChatOpenAI(model=MODEL_NAME, temperature=0.3, api_key=OPENAI_API_KEY)
-        self.chain =  prompt | llm
+    def _cache_put(self, key: Tuple[str, str, str], content: str) -> None:
+        with self._cache_lock:
+            self._cache[key] = content
+            self._cache.move_to_end(key)
+            if len(self._cache) > self.CACHE_SIZE:
+                self._cache.popitem(last=False)
 
     # inputs: {"results": List[Dict], "intent": Dict, "query": str}
-    def invoke(self, inputs: Dict[str, Any]) -> Dict[str, Any]:   
-        try:     
-            start_time = time.time()
-            query = inputs["query"]
-            results = inputs["results"]
-            error = inputs.get("error")
-
-            if error:
-                logger.error(f"Error in inputs: {error}")
-                return f"⚠️ {error}"
-            # logger.info(f"Received inputs: {inputs}")
-            # logger.info(f"\nExplanationAgent invoke: Checking input: {results}")
-            # logger.info(f"Received 1st result: {results[0]}")
-            if not results or len(results) < 2:
-                logger.warning("Not enough data to generate explanation.")
-                return "Not enough data to explain."
-
-            sector_context_data = results[-1]
-            selected_stocks = results[:-1]
-
-            # Format sector context
-            sector_context_str = "\n".join(
-                f"Median {k}: {round(v, 2) if isinstance(v, float) else v}"
-                for k, v in sector_context_data.items()
-                if k not in ["symbol", "name", "sector"]
-            )
-
-            # Format stock descriptions
-            stocks_desc = "\n".join(
-                f"{s['symbol']} ({s['name']}): " + ", ".join(
-                    f"{k}={round(v, 2) if isinstance(v, float) else v}"
-                    for k, v in s.items()
-                    if k not in ["symbol", "name", "sector"]
-                ) for s in selected_stocks
-            )
-
-            logger.info(f"Generating explanation for query: {query}")
-            logger.info(f"Stocks: {stocks_desc}")
-            # logger.info(f"Sector context: {sector_context_str}\n")
-
-            # Run LLM chain
-            response = self.chain.invoke({
-                "input": query,
-                "stocks": stocks_desc,
-                "sector_context": sector_context_str
-            })
-
-            load_time = time.time() - start_time
-            logger.info(f"ExplanationAgent invoke() processed in {load_time:.2f} seconds")
-            return response.content
+    def _prepare(self, inputs: Dict[str, Any]) -> Tuple[Optional[str], Optional[Dict[str, str]]]:
+        """Return (message, None) when there is nothing to explain, else (None, chain inputs)."""
+        query = inputs["query"]
+        results = inputs["results"]
+        error = inputs.get("error")
+
+        if error:
+            logger.error("Error in inputs: %s", error)
+            return f"⚠️ {error}", None
+        # logger.info(f"Received inputs: {inputs}")
+        # logger.info(f"\nExplanationAgent invoke: Checking input: {results}")
+        # logger.info(f"Received 1st result: {results[0]}")
+        if not results or len(results) < 2:
+            logger.warning("Not enough data to generate explanation.")
+            return "Not enough data to explain.", None
+
+        sector_context_data = results[-1]
+        selected_stocks = results[:-1]
+
+        # Format sector context
+        sector_context_str = "\n".join(
+            f"Median {k}: {_fmt(v)}" for k, v in sector_context_data.items() if k not in _SKIP
+        )
+
+        # Format stock descriptions
+        stocks_desc = "\n".join(
+            f"{s['symbol']} ({s['name']}): " + ", ".join(f"{k}={_fmt(v)}" for k, v in s.items() if k not in _SKIP)
+            for s in selected_stocks
+        )
+
+        logger.info("Generating explanation for query: %s", query)
+        logger.info("Stocks: %s", stocks_desc)
+        # logger.info(f"Sector context: {sector_context_str}\n")
+        return None, {"input": query, "stocks": stocks_desc, "sector_context": sector_context_str}
+
+    # Returns the explanation text; raises ExplanationError when the LLM call fails
+    def invoke(self, inputs: Dict[str, Any]) -> str:
+        start_time = time.time()
+        message, chain_inputs = self._prepare(inputs)
+        if message is not None:
+            return message
 
+        key = self._cache_key(chain_inputs)
+        cached = self._cache_get(key)
+        if cached is not None:
+            logger.info("ExplanationAgent cache hit")
+            return cached
+
+        # Only the LLM call is reported as an ExplanationError; bad inputs surface as themselves
+        try:
+            response = self.chain.invoke(chain_inputs)
+        except Exception as e:
+            logger.error("LLM explanation error: %s", e, exc_info=True)
+            raise ExplanationError(f"Failed to generate explanation: {str(e)}") from e
+        self._cache_put(key, response.content)
+
+        load_time = time.time() - start_time
+        logger.info("ExplanationAgent invoke() processed in %.2f seconds", load_time)
+        return response.content
+
+    async def ainvoke(self, inputs: Dict[str, Any], config: Optional[Any] = None, **kwargs: Any) -> str:
+        """Async invoke(): awaits the LLM with chain.ainvoke instead of blocking a worker thread.
+
+        Raises ExplanationError when the LLM call fails, like invoke().
+        """
+        start_time = time.time()
+        message, chain_inputs = self._prepare(inputs)
+        if message is not None:
+            return message
+
+        key = self._cache_key(chain_inputs)
+        cached = self._cache_get(key)
+        if cached is not None:
+            logger.info("ExplanationAgent cache hit")
+            return cached
+
+        try:
+            task = self._inflight.get(key)
+            if task is None:
+                task = asyncio.ensure_future(self.chain.ainvoke(chain_inputs))
+                self._inflight[key] = task
+                task.add_done_callback(lambda _: self._inflight.pop(key, None))
+            else:
+                logger.info("ExplanationAgent joined an in-flight request")
+            # Shielded, so one cancelled caller does not cancel the call the others are waiting on
+            response = await asyncio.shield(task)
         except Exception as e:
-            logger.error(f"LLM explanation error: {e}", exc_info=True)
-            return f"Failed to generate explanation: {str(e)}"
-        
+            logger.error("LLM explanation error: %s", e, exc_info=True)
+            raise ExplanationError(f"Failed to generate explanation: {str(e)}") from e
+        self._cache_put(key, response.content)
+
+        load_time = time.time() - start_time
+        logger.info("ExplanationAgent ainvoke() processed in %.2f seconds", load_time)
+        return response.content
+
+    # Same inputs as invoke(), but yields the explanation text chunk by chunk as the LLM produces it.
+    # Raises ExplanationError if the LLM call fails, possibly after some chunks were yielded.
+    def stream(self, inputs: Dict[str, Any], config: Optional[Any] = None, **kwargs: Any) -> Iterator[str]:
+        start_time = time.time()
+        message, chain_inputs = self._prepare(inputs)
+        if message is not None:
+            yield message
+            return
+
+        key = self._cache_key(chain_inputs)
+        cached = self._cache_get(key)
+        if cached is not None:
+            logger.info("ExplanationAgent cache hit")
+            yield cached
+            return
+
+        parts = []
+        try:
+            for chunk in self.chain.stream(chain_inputs):
+                if chunk.content:
+                    parts.append(chunk.content)
+                    yield chunk.content
+        except Exception as e:
+            logger.error("LLM explanation error: %s", e, exc_info=True)
+            raise ExplanationError(f"Failed to generate explanation: {str(e)}") from e
+        self._cache_put(key, "".join(parts))
+
+        load_time = time.time() - start_time
+        logger.info("ExplanationAgent stream() processed in %.2f seconds", load_time)
+
+    # Async stream(), for the SSE endpoint
+    async def astream(self, inputs: Dict[str, Any], config: Optional[Any] = None, **kwargs: Any) -> AsyncIterator[str]:
+        start_time = time.time()
+        message, chain_inputs = self._prepare(inputs)
+        if message is not None:
+            yield message
+            return
+
+        key = self._cache_key(chain_inputs)
+        cached = self._cache_get(key)
+        if cached is not None:
+            logger.info("ExplanationAgent cache hit")
+            yield cached
+            return
+
+        parts = []
+        try:
+            async for chunk in self.chain.astream(chain_inputs):
+                if chunk.content:
+                    parts.append(chunk.content)
+                    yield chunk.content
+        except Exception as e:
+            logger.error("LLM explanation error: %s", e, exc_info=True)
+            raise ExplanationError(f"Failed to generate explanation: {str(e)}") from e
+        self._cache_put(key, "".join(parts))
+
+        load_time = time.time() - start_time
+        logger.info("ExplanationAgent astream() processed in %.2f seconds", load_time)
+
 
 if __name__ == "__main__":
     agent = ExplanationAgent()
@@ -103,7 +249,7 @@ if __name__ == "__main__":
                 'filters': {'price_lt': 250.0, 'dividendYield_gt': 0.0, 'peRatio_lt': 30.0, 'pbRatio_lt': 15.0, 'freeCashFlowYield_gt': 5.0}, 
             },
             'total_found': 69, 'after_filters': 3, 
-            'input': 'Show me 3 undervalued tech stocks under $250 with dividends',
+            'query': 'Show me 3 undervalued tech stocks under $250 with dividends',
             'results': [
                 {'symbol': 'CTSH', 'name': 'Cognizant', 'sector': 'Information Technology', 'peRatio': 16.621052, 'dividendYield': 154.0, 'freeCashFlowYield': 5.104351825608181, 'pbRatio': 2.6124218, 'price': 78.95}, 
                 {'symbol': 'WDC', 'name': 'Western Digital', 'sector': 'Information Technology', 'peRatio': 19.075342, 'dividendYield': 72.0, 'freeCashFlowYield': 7.237229657750918, 'pbRatio': 3.7548876, 'price': 55.7}, 
@@ -113,5 +259,5 @@ if __name__ == "__main__":
         },
     ]
     
-    results = agent.invoke(test_cases[0])
-    print("Explanation:", results["explanation"])
+    explanation = agent.invoke(test_cases[0])
+    print("Explanation:", explanation)
@@ -1,28 +1,31 @@
 # backend/agents/intent_parser.py
 
-import os
 import logging
-from typing import Dict, Any
-from dotenv import load_dotenv
+from typing import Dict, Any, Final, List, Optional
+import orjson
+import regex
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_core.messages import HumanMessage
+from langchain_core.messages import HumanMessage, SystemMessage
+import textwrap
+import threading
 import time
+from collections import OrderedDict
+from contextlib import aclosing
+from functools import lru_cache
+from types import MappingProxyType
 
+from ..config import settings
+from ._http import get_async_http_client, get_http_client
 from .base import BaseAgent
-from .schemas import IntentSchema
+from .schemas import INTENT_ADAPTER, INTENT_LIST_ADAPTER, IntentSchema
 
-# Load .env
-dotenv_path = os.path.join(os.path.dirname(__file__), "..", ".env")
-load_dotenv(dotenv_path)
-
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-MODEL_NAME = os.getenv("MODEL_NAME")
+OPENAI_API_KEY = settings.openai_api_key
+MODEL_NAME = settings.model_name
 
 logger = logging.getLogger(__name__)
-logging.basicConfig(level=logging.INFO, format='%(levelname)s - %(message)s')
 
-VALID_SECTORS = {
+VALID_SECTORS = MappingProxyType({
     'tech': 'Information Technology',
     'technology': 'Information Technology',
     'energy': 'Energy',
@@ -41,46 +44,190 @@ VALID_SECTORS = {
     'reit': 'Real Estate',
     'real_estate': 'Real Estate',
     'communication': 'Communication Services',
-    'communication_services': 'Communication Services'
+    'communication_services': 'Communication Services',
+    # Variants and common misspellings, accepted rather than sent back for clarification
+    'information_technology': 'Information Technology',
+    'tecnology': 'Information Technology',
+    'helthcare': 'Health Care',
+    'financial_services': 'Financials',
+    'industrial': 'Industrials',
+    'material': 'Materials',
+    'utility': 'Utilities',
+    'utilites': 'Utilities',
+    'reits': 'Real Estate',
+    'realestate': 'Real Estate',
+    'communications': 'Communication Services',
+    'telecom': 'Communication Services',
+})
+# GICS sector names, which the LLM often returns as-is
+_CANONICAL = frozenset(VALID_SECTORS.values())
+_SECTOR_CHOICES = ", ".join(dict.fromkeys(VALID_SECTORS.values()))
+_NORM_TABLE = str.maketrans(" -", "__")  # "health-care", "real estate" -> VALID_SECTORS keys
+
+# ==== Regex fast path ====
+# Handles template-like queries ("Top 5 high dividend REITs", "3 undervalued tech stocks under $150")
+# without an LLM call. Filters mirror the rules in SYSTEM_PROMPT.
+_KEYWORD_FILTERS = {
+    'undervalued': {'peRatio_lt': 25.0, 'pbRatio_lt': 12.0, 'freeCashFlowYield_gt': 0.05},
+    'safe': {'debtToEquity_lt': 10.0, 'revenueGrowth_gt': 0.03},
+    'stable': {'debtToEquity_lt': 10.0, 'revenueGrowth_gt': 0.03},
+    'low debt': {'debtToEquity_lt': 10.0},
+    'high dividend': {'dividendYield_gt': 4.0},
+    'dividend': {'dividendYield_gt': 0.0},
+    'growth': {'revenueGrowth_gt': 0.10, 'freeCashFlowYield_gt': 0.05},
+    'large cap': {'marketCap_gt': 10000000000.0},
+}
+_SECTOR_ALIASES = {
+    'tech': 'tech', 'technology': 'technology', 'energy': 'energy', 'health care': 'health_care',
+    'healthcare': 'healthcare', 'financials': 'financials', 'financial': 'financial', 'finance': 'finance',
+    'consumer discretionary': 'consumer_discretionary', 'discretionary': 'discretionary',
+    'consumer staples': 'consumer_staples', 'staples': 'staples', 'industrials': 'industrials',
+    'materials': 'materials', 'utilities': 'utilities', 'reits': 'reit', 'reit': 'reit',
+    'real estate': 'real_estate', 'communication services': 'communication_services', 'communication': 'communication',
 }
+# Filter keywords and sector names in one alternation, so a query is scanned once for both
+_KEYWORD_RE = regex.compile(
+    r"\b(?:(?P<filter>high[- ]dividends?|dividends?(?:[- ]paying)?|low[- ]debt|large[- ]caps?|undervalued|safe|stable|growth)"
+    r"|(?P<sector>" + "|".join(sorted(map(regex.escape, _SECTOR_ALIASES), key=len, reverse=True)) + r"))\b", regex.I)
+_LIMIT_RE = regex.compile(r"\btop\s+(\d+)\b|\b(\d+)\b(?=\s+(?:\S+\s+){0,4}?stocks?\b)", regex.I)
+_PRICE_RE = regex.compile(r"\b(?:under|below|less than)\s+\$(\d+(?:\.\d+)?)\b", regex.I)
+# Words that carry no screening meaning; any other leftover word sends the query to the LLM
+_FILLER_WORDS = frozenset(
+    "show me find give get list top the a an some any with and in of from sector sectors stock stocks "
+    "companies company that are which pay paying yield yields please".split())
+_WORD_RE = regex.compile(r"[a-z0-9$.']+", regex.I)
+# Anything that may name a sector or industry. A query with none of these cannot get a sector
+# from the LLM either, so it gets the missing-sector answer without the round trip.
+_SECTOR_HINTS = (
+    *_SECTOR_ALIASES, *(key.replace('_', ' ') for key in VALID_SECTORS), *(name.lower() for name in _CANONICAL),
+    'sector', 'industry', 'industries', 'bank', 'banking', 'insurance', 'insurer', 'fintech', 'oil', 'gas',
+    'pharma', 'pharmaceutical', 'biotech', 'medical', 'hospital', 'software', 'semiconductor', 'chip',
+    'cloud', 'internet', 'airline', 'aerospace', 'defense', 'auto', 'automaker', 'retail', 'retailer',
+    'restaurant', 'food', 'beverage', 'media', 'telecommunication', 'mining', 'chemical', 'steel',
+    'property', 'properties', 'landlord', 'electric', 'power', 'water', 'railroad', 'transport',
+)
+_SECTOR_HINT_RE = regex.compile(
+    r"\b(?:" + "|".join(sorted(set(map(regex.escape, _SECTOR_HINTS)), key=len, reverse=True)) + r")s?\b", regex.I)
+
+
+def _fast_parse(query: str) -> Optional[Dict[str, Any]]:
+    """Parse a template-like query without the LLM, or return None when any part of it is not understood."""
+    text = query.lower()
+    prices = _PRICE_RE.findall(text)
+    text = _PRICE_RE.sub(" ", text)  # so "under $50 energy stocks" is not read as a limit of 50
+    limits = [a or b for a, b in _LIMIT_RE.findall(text)]
+    if len(prices) > 1 or len(limits) > 1:
+        return None
+
+    filters: Dict[str, float] = {}
+    sectors = set()
+    leftover = []  # text between keyword matches
+    end = 0
+    for match in _KEYWORD_RE.finditer(text):
+        leftover.append(text[end:match.start()])
+        end = match.end()
+        if match.group("sector"):
+            sectors.add(_SECTOR_ALIASES[match.group("sector")])
+            continue
+        word = regex.sub(r"[- ]", " ", match.group("filter"))
+        if word.startswith("high dividend"):
+            filters.update(_KEYWORD_FILTERS['high dividend'])
+        elif word.startswith("dividend"):
+            filters.setdefault('dividendYield_gt', 0.0)
+        elif word.startswith("large cap"):
+            filters.update(_KEYWORD_FILTERS['large cap'])
+        else:
+            filters.update(_KEYWORD_FILTERS[word])
+    leftover.append(text[end:])
+
+    if len(sectors) != 1:
+        return None
+    if prices:
+        filters['price_lt'] = float(prices[0])
+    if not filters:
+        return None
+
+    # Only take the fast path when every remaining word is filler
+    for word in _WORD_RE.findall(" ".join(leftover)):
+        if word not in _FILLER_WORDS and word not in limits:
+            return None
+
+    return IntentSchema(
+        sector=sectors.pop(),
+        limit=int(limits[0]) if limits else None,
+        metrics=list(dict.fromkeys(key.rsplit('_', 1)[0] for key in filters)),
+        filters=filters,
+    ).model_dump()
+
+# System message and prompt template, built once at import and shared by every IntentParserAgent.
+# Dedented and kept byte-identical across calls, so OpenAI's automatic prompt caching can reuse the prefix.
+SYSTEM_PROMPT: Final[str] = textwrap.dedent("""\
+        You are a financial assistant. Parse a stock screening query into 1 JSON object with keys:
+        sector, limit (optional), metrics, filters (optional, "<metric>_lt" / "_gt" / "_eq": number).
+
+        Rules: undervalued: peRatio < 25, pbRatio < 12, freeCashFlowYield > 0.05; safe, stable: debtToEquity < 10.0, revenueGrowth > 0.03;
+        low debt: debtToEquity < 10.0; high dividend: dividendYield > 4; dividend paying: dividendYield > 0;
+        growth: revenueGrowth > 0.10, freeCashFlowYield > 0.05; large cap: marketCap > 10000000000; under $N: price_lt = N; top N stocks: limit = N.
+
+        Example: {{"sector": "technology", "limit": 3, "metrics": ["price", "peRatio"], "filters": {{"price_lt": 50, "dividendYield_gt": 0}}}}
+
+        Return ONLY the raw JSON object without any explanations or markdown formatting.
+        """)
+
+# System prompts are passed as ready-made SystemMessages rather than ("system", template) pairs,
+# so the templates only fill in the messages and no longer re-format the system text on every call
+PROMPT_TEMPLATE = ChatPromptTemplate.from_messages([
+    SystemMessage(content=SYSTEM_PROMPT.format()),
+    MessagesPlaceholder(variable_name="messages")
+])
+
+# Several numbered queries in one request share the system prompt and a single round trip
+BATCH_PROMPT_TEMPLATE = ChatPromptTemplate.from_messages([
+    SystemMessage(content=(SYSTEM_PROMPT + "\nWhen given numbered requests, instead return ONLY 1 raw JSON object "
+                                           "{{\"intents\": [...]}} holding one such object per request, in the same order.\n").format()),
+    MessagesPlaceholder(variable_name="messages")
+])
+
+
+MAX_TOKENS = 150  # a full intent object is well under 100 tokens
+
+@lru_cache(maxsize=4)
+def _get_llm(model_name: str) -> ChatOpenAI:
+    """One ChatOpenAI client per model, on the process-wide HTTP connection pool."""
+    return ChatOpenAI(
+        model=model_name,
+        temperature=0.1,
+        max_tokens=MAX_TOKENS,
+        api_key=OPENAI_API_KEY,
+        http_client=get_http_client(),
+        http_async_client=get_async_http_client(),
+    )
+
+def _strip_code_fence(content: str) -> str:
+    """Drop a ```json ... ``` markdown fence the model sometimes wraps around the JSON."""
+    content = content.strip()
+    if content.startswith("```"):
+        content = content.split("\n", 1)[1] if "\n" in content else content[3:]
+        content = content.removesuffix("```").strip()
+    return content
+
+def _normalize_query(query: str) -> str:
+    """Cache key for a query: lowercased, whitespace collapsed, trailing punctuation dropped."""
+    return " ".join(query.lower().split()).strip(" ?!.")
 
 class IntentParserAgent(BaseAgent):
+    CACHE_SIZE = 1024  # parsed intents kept in memory
+
     def __init__(self, model_name: str = MODEL_NAME):
         self.model_name = model_name
-        self.llm = ChatOpenAI(
-            model=model_name,
-            temperature=0.1,
-            max_tokens=300,
-            api_key=OPENAI_API_KEY
-        )
-        self.prompt_template = ChatPromptTemplate.from_messages([
-            (
-                "system",
-                """
-                You are a financial assistant. Parse stock screening query into structured JSON format.
-                Return a JSON object with the following keys: intent, sector, limit (optional), metrics, filters (optional)
-
-                Rules:
-                - undervalued: peRatio < 25, pbRatio < 12, freeCashFlowYield > 0.05
-                - safe, stable: debtToEquity < 10.0, revenueGrowth > 0.03
-                - low debt: debtToEquity < 10.0
-                - high dividend: dividendYield > 4
-                - dividend paying: dividendYield > 0
-                - growth: revenueGrowth > 0.10, freeCashFlowYield > 0.05
-                - large cap: marketCap > 10000000000
-                - under $N: price_lt = N
-                - top N stocks: limit = N
-
-                Example output:
-                {{"sector": "technology", "limit": 3, "metrics": ["price", "peRatio", "pbRatio"], "filters": {{"price_lt": 50, "dividendYield_gt": 0, "freeCashFlowYield_gt": 5}}}}
-                {{"sector": "real estate", "limit": 5, "metrics": ["price", "dividendYield"], "filters": {{"debtToEquity_lt": 5.0, "revenueGrowth_gt": 5}}}}
-
-                Return ONLY 1 raw JSON object without any explanations or markdown formatting.
-                """
-            ),
-            MessagesPlaceholder(variable_name="messages")
-        ])
+        # JSON mode: the API only returns syntactically valid JSON objects, so parse failures (and re-asks) go away
+        self.llm = _get_llm(model_name).bind(response_format={"type": "json_object"})
+        self.prompt_template = PROMPT_TEMPLATE
         self.chain = self.prompt_template | self.llm
+        # LLM-parsed intents keyed by normalized query, so a repeated query skips the LLM.
+        # Context is merged after the lookup, so cached intents are context-free.
+        self._cache: "OrderedDict[str, IntentSchema]" = OrderedDict()
+        self._cache_lock = threading.Lock()
 
     # input: {"query": "Show me 3 undervalued tech stocks under $50 with dividends", "context_intent": {'sector': 'energy', ...}}
     def invoke(self, input: Dict[str, Any]) -> Dict[str, Any]:        
@@ -92,29 +239,150 @@ class IntentParserAgent(BaseAgent):
         if not query:
             raise ValueError("Missing 'query' in input")
         
-        message = HumanMessage(content=f"Parse this request:\n{query}" \
-                               "\nRespond only with JSON, NO TEXT BEFORE OR AFTER.")
+        result = None
         try:
-            result = self.chain.invoke({"messages": [message]})
-            content = result.content.strip()
+            parsed_intent = self._parse_without_llm(query, context_intent)
+            if parsed_intent is not None:
+                logger.info("Parsed query without the LLM")
+            else:
+                result = self.chain.invoke({"messages": [self._message(query)]})
+                parsed_intent = self._parse_content(query, result.content)
+            # logger.info(f"Parsed intent: {parsed_intent}")
+        except Exception as e:
+            return self._parse_error(query, e, result.content if result is not None else None)
+
+        results = self._finalize(query, context_intent, parsed_intent)
+        load_time = time.time() - start_time
+        logger.info("IntentParserAgent invoke processed in %.2f seconds", load_time)
 
-            # Try parsing JSON safely
-            parsed = IntentSchema.model_validate_json(content)
-            # logger.info(f"Parsed intent: {parsed.model_dump()}")
+        return results
+
+    # Same as invoke(), but streams the LLM output so concurrent requests do not block the event loop
+    async def ainvoke(self, input: Dict[str, Any], config: Optional[Any] = None, **kwargs: Any) -> Dict[str, Any]:
+        start_time = time.time()
+
+        query = input.get("query")
+        context_intent = input.get("context_intent")  # Optional previous intent
+
+        if not query:
+            raise ValueError("Missing 'query' in input")
 
-            # If parsed intent is vague (e.g., missing key info), merge with context
-            final_intent = self._update_intent(context_intent, parsed.model_dump())
-            # logger.info(f"Final intent: {final_intent}")
-                
+        result = None
+        try:
+            parsed_intent = self._parse_without_llm(query, context_intent)
+            if parsed_intent is not None:
+                logger.info("Parsed query without the LLM")
+            else:
+                result = ""
+                # Stream the completion and stop as soon as the buffered text is a complete, valid intent.
+                # aclosing() closes the stream on that early break, which cancels the rest of the HTTP response.
+                async with aclosing(self.chain.astream({"messages": [self._message(query)]})) as stream:
+                    async for chunk in stream:
+                        result += chunk.content
+                        if "}" in chunk.content:
+                            try:
+                                parsed_intent = self._parse_content(query, result)
+                                break
+                            except ValueError:  # not a complete object yet
+                                pass
+                    else:
+                        parsed_intent = self._parse_content(query, result)
         except Exception as e:
-            logger.warning(f"LLM failed to produce valid JSON error: {e}")
-            logger.warning(f"LLM failed to produce valid JSON from: {result.content}")
-            return {
-                "clarification_needed": False,
-                "error": "Could not parse your request. Please clarify your sector or filters.",
-                "raw_response": result.content,
-                "query": query
-            }
+            return self._parse_error(query, e, result)
+
+        results = self._finalize(query, context_intent, parsed_intent)
+        load_time = time.time() - start_time
+        logger.info("IntentParserAgent ainvoke processed in %.2f seconds", load_time)
+
+        return results
+
+    def _parse_without_llm(self, query: str, context_intent: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Return the intent from the fast path or the cache, an empty intent when the query names no sector, or None."""
+        parsed_intent = _fast_parse(query) or self._cache_get(query)
+        if parsed_intent is None and not _SECTOR_HINT_RE.search(query) and not (context_intent or {}).get('sector'):
+            return {}  # _finalize() turns this into the missing-sector clarification
+        return parsed_intent
+
+    @staticmethod
+    def _message(query: str) -> HumanMessage:
+        return HumanMessage(content=f"Parse this request:\n{query}" \
+                            "\nRespond only with JSON, NO TEXT BEFORE OR AFTER.")
+
+    def _parse_content(self, query: str, content: str) -> Dict[str, Any]:
+        # Parse and validate in one pass with the prebuilt adapter, no intermediate dict
+        intent = INTENT_ADAPTER.validate_json(_strip_code_fence(content))
+        self._cache_put(query, intent)
+        return intent.model_dump()
+
+    def _cache_get(self, query: str) -> Optional[Dict[str, Any]]:
+        key = _normalize_query(query)
+        with self._cache_lock:
+            intent = self._cache.get(key)
+            if intent is not None:
+                self._cache.move_to_end(key)
+        # A fresh dict per hit, so callers can not mutate the cached intent
+        return intent.model_dump() if intent is not None else None
+
+    def _cache_put(self, query: str, intent: IntentSchema) -> None:
+        key = _normalize_query(query)
+        with self._cache_lock:
+            self._cache[key] = intent
+            self._cache.move_to_end(key)
+            if len(self._cache) > self.CACHE_SIZE:
+                self._cache.popitem(last=False)
+
+    def batch_invoke(self, queries: List[str], context_intent: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """Parse several queries with at most one LLM call, returning one invoke()-style result per query."""
+        start_time = time.time()
+        if not all(queries):
+            raise ValueError("Missing 'query' in input")
+
+        parsed_intents: List[Optional[Dict[str, Any]]] = [self._parse_without_llm(query, context_intent) for query in queries]
+        pending = [i for i, parsed in enumerate(parsed_intents) if parsed is None]
+        # A single leftover query goes through invoke() below, no need for the array prompt
+        if len(pending) > 1:
+            numbered = "\n".join(f"[{n}] {queries[i]}" for n, i in enumerate(pending))
+            message = HumanMessage(content=f"Parse these {len(pending)} requests:\n{numbered}" \
+                                   "\nRespond only with the JSON object, NO TEXT BEFORE OR AFTER.")
+            try:
+                # Room for one intent object per query
+                batch_chain = BATCH_PROMPT_TEMPLATE | self.llm.bind(max_tokens=MAX_TOKENS * len(pending))
+                result = batch_chain.invoke({"messages": [message]})
+                payload = orjson.loads(_strip_code_fence(result.content))
+                intents = INTENT_LIST_ADAPTER.validate_python(payload.get("intents") if isinstance(payload, dict) else payload)
+                if len(intents) != len(pending):
+                    raise ValueError(f"expected {len(pending)} intents, got {len(intents)}")
+            except Exception as e:
+                # One bad array should not fail every query, so parse the leftovers one by one
+                logger.warning("Batch parse failed, falling back to single queries: %s", e)
+                intents = None
+            for n, i in enumerate(pending):
+                if intents is not None:
+                    self._cache_put(queries[i], intents[n])
+                    parsed_intents[i] = intents[n].model_dump()
+
+        results = [self._finalize(query, context_intent, parsed) if parsed is not None
+                   else self.invoke({"query": query, "context_intent": context_intent})
+                   for query, parsed in zip(queries, parsed_intents)]
+        load_time = time.time() - start_time
+        logger.info("IntentParserAgent batch_invoke processed %s queries in %.2f seconds", len(queries), load_time)
+        return results
+
+    def _parse_error(self, query: str, error: Exception, raw_response: Optional[str]) -> Dict[str, Any]:
+        logger.warning("LLM failed to produce valid JSON error: %s", error)
+        logger.warning("LLM failed to produce valid JSON from: %s", raw_response)
+        return {
+            "clarification_needed": False,
+            "error": "Could not parse your request. Please clarify your sector or filters.",
+            "raw_response": raw_response,
+            "query": query
+        }
+
+    def _finalize(self, query: str, context_intent: Optional[Dict[str, Any]], parsed_intent: Dict[str, Any]) -> Dict[str, Any]:
+        """Merge the parsed intent with the context and validate its sector."""
+        # If parsed intent is vague (e.g., missing key info), merge with context
+        final_intent = self._update_intent(context_intent, parsed_intent)
+        # logger.info(f"Final intent: {final_intent}")
 
         sector = final_intent.get('sector', '')
         if not sector:
@@ -126,19 +394,20 @@ class IntentParserAgent(BaseAgent):
                 "query": query
             }
 
-        normalized_sector = sector.strip().lower().replace(" ", "_")
-        # logger.info(f"Normalized sector: {normalized_sector}")
-        if normalized_sector not in VALID_SECTORS:
-            logger.warning(f"Invalid sector: {sector}")
-            results = {
-                "clarification_needed": True,
-                "error": f"'{sector}' is not a valid sector. Please try one of: {', '.join(VALID_SECTORS.values())}",
-                "parsed": final_intent,
-                "query": query
-            }
-            # logger.info(f">> IntentParserAgent results:\n {results}")
-            return results 
-        else:
+        # Canonical GICS names are used as-is, without normalization
+        if sector not in _CANONICAL:
+            normalized_sector = sector.strip().lower().translate(_NORM_TABLE)
+            # logger.info(f"Normalized sector: {normalized_sector}")
+            if normalized_sector not in VALID_SECTORS:
+                logger.warning("Invalid sector: %s", sector)
+                results = {
+                    "clarification_needed": True,
+                    "error": f"'{sector}' is not a valid sector. Please try one of: {_SECTOR_CHOICES}",
+                    "parsed": final_intent,
+                    "query": query
+                }
+                # logger.info(f">> IntentParserAgent results:\n {results}")
+                return results 
             final_intent["sector"] = VALID_SECTORS[normalized_sector]
             # logger.info(f"Valid sector: {final_intent.sector}")
 
@@ -147,21 +416,16 @@ class IntentParserAgent(BaseAgent):
             "intent": final_intent,
             "query": query
         }
-        logger.info(f">> IntentParserAgent results:\n {results}")
-        load_time = time.time() - start_time
-        logger.info(f"IntentParserAgent invoke processed in {load_time:.2f} seconds")
-
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(">> IntentParserAgent results:\n %s", results)
         return results
     
     def _update_intent(self, context: Dict[str, Any], current: Dict[str, Any]) -> Dict[str, Any]:
         final_intent = current.copy()
         
-        # Handle metrics: add 'price' or 'peRatio' if not present
-        current_metrics = current.get('metrics', [])
-        if 'price' not in final_intent['metrics']:
-            final_intent['metrics'] = final_intent['metrics'] + ['price']
-        if 'peRatio' not in final_intent['metrics']:
-            final_intent['metrics'] = final_intent['metrics'] + ['peRatio']
+        # Handle metrics: add 'price' or 'peRatio' if not present, deduplicated in order
+        metrics = dict.fromkeys(final_intent.get('metrics') or [])
+        metrics.update(dict.fromkeys(('price', 'peRatio')))
         
         if context: 
             # No filters means user asked a follow up question like "How about energy stocks?"
@@ -170,11 +434,9 @@ class IntentParserAgent(BaseAgent):
                 if not final_intent.get('limit') and context.get('limit'):
                     final_intent['limit'] = context['limit']
                 # Merge metrics from context and current, then deduplicate
-                context_metrics = context.get('metrics', [])
-                current_metrics = final_intent.get('metrics', [])
-                merged_metrics = list(set(context_metrics + current_metrics))
-                final_intent['metrics'] = merged_metrics
+                metrics = dict.fromkeys([*context.get('metrics', []), *metrics])
         
+        final_intent['metrics'] = list(metrics)
         return final_intent
     
 # 1. Query: Show me 3 undervalued tech stocks under $50 with dividends
@@ -1,17 +1,25 @@
 # backend/models/schemas.py
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter
 from typing import List, Dict, Optional, Any
 
 class QueryInputSchema(BaseModel):
     query: str
     context_intent: Optional[Dict] = None
+    session_id: Optional[str] = None  # Server remembers the last intent, so context_intent can be omitted
 
 # Schema for the intent parsed from user input
 class IntentSchema(BaseModel):
+    # Drop unknown keys, such as the legacy "intent": "screen", so they never reach the data processor
+    model_config = ConfigDict(extra='ignore')
+
     sector: Optional[str] = None
     limit: Optional[int] = None
-    metrics: List[str]
-    filters: Optional[Dict[str, float]] = {}
+    metrics: List[str] = Field(default_factory=list)
+    filters: Optional[Dict[str, float]] = Field(default_factory=dict)
+
+# Validators built once at import instead of per parse
+INTENT_ADAPTER = TypeAdapter(IntentSchema)
+INTENT_LIST_ADAPTER = TypeAdapter(List[IntentSchema])
 
 # Schema for the stock screening results
 class StockSchema(BaseModel):
@@ -1,52 +1,239 @@
-from fastapi import FastAPI, HTTPException
-from fastapi.middleware.cors import CORSMiddleware
-from backend.agents.schemas import QueryInputSchema
-from backend.chains.inter_agent_chain import inter_agent_chain
+import asyncio
+import hmac
 import logging
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+import orjson
+
+# Configured once here; library modules only create their own loggers
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+from fastapi import BackgroundTasks, FastAPI, Header, HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse
+from backend.agents._http import prewarm
+from backend.agents.schemas import QueryInputSchema
+from backend.config import settings
+from backend.chains.inter_agent_chain import data_processor, inter_agent_chain
 
-# http://localhost:8000/docs — Swagger UI
+class ORJSONResponse(JSONResponse):
+    """JSON response rendered by orjson, which also handles the NumPy scalars in stock results."""
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+
+# Agents, prompts, the numba kernel and the sectors data are all built when the chain module is
+# imported; what is left cold at startup is the connection to the LLM provider.
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await prewarm(f"{settings.openai_base_url}/models")
+    yield
+
+# http://localhost:8000/docs — Swagger UI, unless API_DOCS=0
 app = FastAPI(
     title="Stock Screening Assistant",
     description="API for screening stocks based on financial metrics and filters.",
     version="1.0.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan,
+    docs_url="/docs" if settings.api_docs else None,
+    redoc_url="/redoc" if settings.api_docs else None,
+    openapi_url="/openapi.json" if settings.api_docs else None,
 )
 
 logger = logging.getLogger(__name__)
 
-@app.post("/query")
+# Responses for repeated (query, context_intent) pairs, e.g. re-sent from the chat history.
+# Only touched from the event loop thread, so no lock is needed.
+RESPONSE_CACHE_SIZE = 1024
+RESPONSE_CACHE_TTL = 300  # seconds, short enough that refreshed sectors data shows up soon
+_response_cache: "OrderedDict[Tuple[str, bytes], Tuple[float, Dict[str, Any]]]" = OrderedDict()
+
+def _cache_key(query: str, context_intent: Dict[str, Any]) -> Tuple[str, bytes]:
+    return " ".join(query.lower().split()), orjson.dumps(context_intent, option=orjson.OPT_SORT_KEYS)
+
+def _cache_get(key: Tuple[str, bytes]) -> Optional[Dict[str, Any]]:
+    entry = _response_cache.get(key)
+    if entry is None:
+        return None
+    expires_at, response = entry
+    if expires_at < time.monotonic():
+        del _response_cache[key]
+        return None
+    _response_cache.move_to_end(key)
+    return response
+
+def _is_cacheable(body: Dict[str, Any]) -> bool:
+    """Only complete answers are cached: a clarification or a failed explanation may well differ on retry."""
+    return bool(body.get("success") and body.get("explanation") and not body.get("explanation_failed"))
+
+def _cache_put(key: Tuple[str, bytes], response: Dict[str, Any]) -> None:
+    _response_cache[key] = (time.monotonic() + RESPONSE_CACHE_TTL, response)
+    _response_cache.move_to_end(key)
+    if len(_response_cache) > RESPONSE_CACHE_SIZE:
+        _response_cache.popitem(last=False)
+
+# Last successful intent per session, used as context_intent when the client does not send one
+SESSION_MEMORY_SIZE = 10000
+_session_intents: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+def _remember_intent(session_id: Optional[str], body: Dict[str, Any]) -> None:
+    if session_id and body.get("success"):
+        _session_intents[session_id] = body["intent"]
+        _session_intents.move_to_end(session_id)
+        if len(_session_intents) > SESSION_MEMORY_SIZE:
+            _session_intents.popitem(last=False)
+
+def _clarification_body(result: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "success": False,
+        "clarification_needed": True,
+        "error": result.get("error", "Clarification required."),
+        "parsed_intent": result.get("parsed", {})
+    }
+
+@app.post("/query", response_model=None)
 async def handle_query(input: QueryInputSchema):
     user_input = input.query.strip()
-    context_intent = input.context_intent or {}
+    context_intent = input.context_intent or _session_intents.get(input.session_id or "") or {}
 
     if not user_input:
         raise HTTPException(status_code=400, detail="Query input is required")
 
+    key = _cache_key(user_input, context_intent)
+    cached = _cache_get(key)
+    if cached is not None:
+        _remember_intent(input.session_id, cached)
+        return ORJSONResponse(cached, headers={"X-Cache": "HIT"})
+
     try:
-        result = inter_agent_chain.invoke({
+        result = await inter_agent_chain.ainvoke({
             "query": user_input,
             "context_intent": context_intent
         })
 
         if result.get("short_circuit"):  # Defined by clarification_router
-            return {
-                "success": False,
-                "clarification_needed": True,
-                "error": result.get("error", "Clarification required."),
-                "parsed_intent": result.get("parsed", {})
+            body = _clarification_body(result)
+        else:
+            # logger.info(f"Result from inter-agent chain: \n{result}")
+            body = {
+                "success": True,
+                "explanation": result.get("explanation"),
+                "results": result.get("results", []),
+                "intent": result.get("intent", {}),
             }
-
-        # logger.info(f"Result from inter-agent chain: \n{result}")
-        return {
-            "success": True,
-            "explanation": result.get("explanation"),
-            "results": result.get("results", []),
-            "intent": result.get("intent", {}),
-        }
+            if result.get("explanation_failed"):
+                body["explanation_failed"] = True  # explanation holds the error message
+        if _is_cacheable(body):
+            _cache_put(key, body)
+        _remember_intent(input.session_id, body)
+        # Returned as a response object, so the body skips FastAPI's jsonable_encoder pass
+        return ORJSONResponse(body, headers={"X-Cache": "MISS"})
     except Exception as e:
         logger.exception("Query handling failed")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _sse(event: str, data: Any) -> bytes:
+    return b"event: " + event.encode() + b"\ndata: " + \
+        orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY) + b"\n\n"
+
+async def _query_events(inputs: Dict[str, Any], key: Tuple[str, bytes], session_id: Optional[str],
+                        cached: Optional[Dict[str, Any]]) -> AsyncIterator[bytes]:
+    if cached is not None:  # only complete answers are cached
+        _remember_intent(session_id, cached)
+        yield _sse("intent", cached["intent"])
+        yield _sse("results", cached["results"])
+        yield _sse("explanation_delta", {"text": cached["explanation"]})
+        yield _sse("done", {"success": True, "explanation_failed": False})
+        return
+
+    try:
+        body: Dict[str, Any] = {"success": True}
+        parts = []
+        async for event, data in inter_agent_chain.astream(inputs):
+            if event == "clarification":
+                yield _sse("clarification", _clarification_body(data))
+                return
+            if event == "explanation_delta":
+                parts.append(data)
+                yield _sse(event, {"text": data})
+            elif event == "explanation_error":
+                parts = [data]  # same body as /query, where explanation holds the error message
+                body["explanation_failed"] = True
+                yield _sse(event, {"detail": data})
+            else:
+                body[event] = data
+                yield _sse(event, data)
+        body["explanation"] = "".join(parts)
+        yield _sse("done", {"success": True, "explanation_failed": body.get("explanation_failed", False)})
+        # Completed streams fill the same cache /query reads from, unless the explanation failed
+        if _is_cacheable(body):
+            _cache_put(key, body)
+        _remember_intent(session_id, body)
+    except Exception as e:
+        # Headers are already sent, so the failure is reported as an event rather than a 500
+        logger.exception("Query streaming failed")
+        yield _sse("error", {"detail": str(e)})
+
+# Same as /query, but as Server-Sent Events: "intent" once parsed, "results" once screened,
+# then "explanation_delta" chunks as the LLM writes ("explanation_error" if it fails), and "done"
+# (or "clarification" / "error")
+@app.post("/query/stream", response_model=None)
+async def handle_query_stream(input: QueryInputSchema):
+    user_input = input.query.strip()
+    context_intent = input.context_intent or _session_intents.get(input.session_id or "") or {}
+
+    if not user_input:
+        raise HTTPException(status_code=400, detail="Query input is required")
+
+    key = _cache_key(user_input, context_intent)
+    cached = _cache_get(key)
+    inputs = {"query": user_input, "context_intent": context_intent}
+    return StreamingResponse(
+        _query_events(inputs, key, input.session_id, cached),
+        media_type="text/event-stream",
+        headers={"X-Cache": "HIT" if cached is not None else "MISS", "Cache-Control": "no-cache"},
+    )
+
+
+async def _refresh_sectors_data() -> None:
+    # The refetch runs in a worker thread; the response cache is cleared back on the event loop, which is the
+    # only thread touching it, and only once the new data is in
+    if await asyncio.to_thread(data_processor.refresh):
+        _response_cache.clear()
+
+@app.post("/cache/refresh", status_code=202)
+async def refresh_cache(background_tasks: BackgroundTasks, x_admin_token: Optional[str] = Header(None)):
+    """Refetch the sectors data in the background, e.g. from a nightly job after the market data changes."""
+    if not settings.admin_token or not hmac.compare_digest((x_admin_token or "").encode(), settings.admin_token.encode()):
+        raise HTTPException(status_code=403, detail="Forbidden")
+    if data_processor.is_refreshing:
+        return {"status": "already refreshing"}
+    # Queries keep being answered from the current snapshot until the refetch completes
+    background_tasks.add_task(_refresh_sectors_data)
+    return {"status": "refreshing"}
+
+
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"}
\ No newline at end of file
+    return {"status": "healthy"}
+
+
+if __name__ == "__main__":
+    import os
+    import uvicorn
+
+    # "auto" picks uvloop and httptools when installed. One worker by default: the response
+    # cache and session memory live in process.
+    uvicorn.run(
+        "backend.api.main:app",
+        host="0.0.0.0",
+        port=8000,
+        loop="auto",
+        http="auto",
+        workers=int(os.getenv("WEB_CONCURRENCY", "1")),
+        access_log=False,
+    )
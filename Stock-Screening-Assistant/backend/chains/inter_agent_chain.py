@@ -1,58 +1,124 @@
-from langchain_core.runnables import RunnableMap, RunnableLambda
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Dict, Tuple
 from backend.agents.intent_parser import IntentParserAgent
 from backend.agents.data_processor import DataProcessorAgent
-from backend.agents.explanation import ExplanationAgent
-from functools import partial
+from backend.agents.explanation import ExplanationAgent, ExplanationError
 
 # Instantiate agents once to maintain cache across requests
 intent_parser = IntentParserAgent()
 data_processor = DataProcessorAgent()
 explanation_agent = ExplanationAgent()
 
+# Bounded pool for the data processor's filter/sort work, kept apart from the loop's default executor
+# (used for blocking IO) so a burst of screens cannot starve it. Threads rather than processes: the
+# numba kernel releases the GIL, and pickling sector frames to a process would cost more than the screen.
+# At least 4 workers, since a screen can briefly wait on the stale-data reload lock.
+_PROCESSOR_POOL = ThreadPoolExecutor(max_workers=max(4, os.cpu_count() or 1), thread_name_prefix="data-processor")
+
+# The pipeline is plain function calls rather than piped RunnableLambdas: the steps are fixed and
+# local, so LangChain's per-step config, callback manager and tracer setup bought nothing.
+
 # Step 1: Run intent parser
-# from main.py: inter_agent_chain.invoke({"query": user_input})
-parser_step = RunnableLambda(lambda inputs: intent_parser.invoke(inputs))
-# returns a dict with keys: intent (if parse successfully), input, clarification_needed, error (if any), 
+# from main.py: await inter_agent_chain.ainvoke({"query": user_input})
+async def aparse(inputs):
+    if not data_processor.is_stale:
+        return await intent_parser.ainvoke(inputs)
+    # Reload stale sectors data while the LLM parses the intent, rather than after it
+    parsed, _ = await asyncio.gather(intent_parser.ainvoke(inputs), asyncio.to_thread(data_processor.refresh_if_stale))
+    return parsed
+# returns a dict with keys: intent (if parse successfully), input, clarification_needed, error (if any),
 # raw_response (if cannot parse input)
 # and parsed (if clarification_needed is True)
 
 # Step 2: Route based on clarification_needed flag
-clarification_router = RunnableLambda(
-    lambda parsed: {
-        "short_circuit": True,
-        "error": parsed.get("error", "Clarification required."),
-        "parsed": parsed.get("parsed", {}),
-        "raw_response": parsed.get("raw_response"),
-    } if parsed.get("clarification_needed") else {
+def clarification_router(parsed):
+    if parsed.get("clarification_needed"):
+        return {
+            "short_circuit": True,
+            "error": parsed.get("error", "Clarification required."),
+            "parsed": parsed.get("parsed", {}),
+            "raw_response": parsed.get("raw_response"),
+        }
+    # input structure for DataProcessorAgent invoke() is {"intent": intent, "query": query}
+    return {
         "intent": parsed["intent"],
         "query": parsed["query"],
-    }   # input structure for DataProcessorAgent invoke() is {"intent": intent, "query": query}
-)
+    }
 
 # Step 3: Run data processor
-# processor_step = RunnableLambda(lambda x: data_processor.invoke(x)) # to pass both intent and query, rather than just x["intent"]
 def run_data_processor(data, agent: DataProcessorAgent):
     # data should contain {"intent": intent, "query": query} from clarification_router
     result = agent.invoke(data)         # include intent and query in the input
     return {
         **data,
         "results": result["results"]    # Add results to the data
-    } 
-processor_step = RunnableLambda(partial(run_data_processor, agent=data_processor))
+    }
 
 # Step 4: Run explanation agent
-# explainer_step = RunnableLambda(lambda x: explanation_agent.invoke(x))
+def _explanation_failed(data, error: ExplanationError):
+    # The results are still worth returning; the flag keeps the response out of the caches
+    return {**data, "explanation": str(error), "explanation_failed": True}
+
 def run_explainer(data, agent: ExplanationAgent):
     # data should contain {"intent": intent, "query": query, "results": results}
-    explanation = agent.invoke(data)
+    try:
+        explanation = agent.invoke(data)
+    except ExplanationError as e:
+        return _explanation_failed(data, e)
     return {**data, "explanation": explanation} # data should contain {"intent": intent, "query": query, "results": results, "explanation": explanation}
 
-explainer_step = RunnableLambda(partial(run_explainer, agent=explanation_agent))
+async def arun_data_processor(data, agent: DataProcessorAgent):
+    return await asyncio.get_running_loop().run_in_executor(_PROCESSOR_POOL, run_data_processor, data, agent)
+
+async def arun_explainer(data, agent: ExplanationAgent):
+    try:
+        explanation = await agent.ainvoke(data)
+    except ExplanationError as e:
+        return _explanation_failed(data, e)
+    return {**data, "explanation": explanation}
 
 # Step 5: Compose full inter-agent chain
-inter_agent_chain = (
-    parser_step
-    | clarification_router
-    | RunnableLambda(lambda x: x if x.get("short_circuit") else processor_step.invoke(x))
-    | RunnableLambda(lambda x: explainer_step.invoke(x) if not x.get("short_circuit") and "results" in x else x)
-)
+def run_pipeline(inputs: Dict[str, Any]) -> Dict[str, Any]:
+    routed = clarification_router(intent_parser.invoke(inputs))
+    if routed.get("short_circuit"):
+        return routed
+    return run_explainer(run_data_processor(routed, data_processor), explanation_agent)
+
+async def arun_pipeline(inputs: Dict[str, Any]) -> Dict[str, Any]:
+    routed = clarification_router(await aparse(inputs))
+    if routed.get("short_circuit"):
+        return routed
+    data = await arun_data_processor(routed, data_processor)
+    return await arun_explainer(data, explanation_agent)
+
+async def astream_pipeline(inputs: Dict[str, Any]) -> AsyncIterator[Tuple[str, Any]]:
+    """Yield (event, data) as each stage finishes: the intent, the results, then the explanation chunk by chunk
+    (ending with "explanation_error" if the LLM call fails)."""
+    routed = clarification_router(await aparse(inputs))
+    if routed.get("short_circuit"):
+        yield "clarification", routed
+        return
+    yield "intent", routed["intent"]
+    data = await arun_data_processor(routed, data_processor)
+    yield "results", data["results"]
+    try:
+        async for chunk in explanation_agent.astream(data):
+            yield "explanation_delta", chunk
+    except ExplanationError as e:
+        yield "explanation_error", str(e)
+
+class InterAgentChain:
+    """Keeps the Runnable-style invoke()/ainvoke()/astream() interface main.py calls."""
+
+    def invoke(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        return run_pipeline(inputs)
+
+    async def ainvoke(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        return await arun_pipeline(inputs)
+
+    def astream(self, inputs: Dict[str, Any]) -> AsyncIterator[Tuple[str, Any]]:
+        return astream_pipeline(inputs)
+
+inter_agent_chain = InterAgentChain()
@@ -0,0 +1,35 @@
+# backend/config.py
+import os
+from dataclasses import dataclass, field
+from typing import Optional
+
+from dotenv import load_dotenv
+
+# Read .env once per process, not once per agent module
+load_dotenv(os.path.join(os.path.dirname(__file__), ".env"))
+
+
+@dataclass(frozen=True)
+class Settings:
+    openai_api_key: Optional[str] = field(repr=False)
+    model_name: str
+    openai_base_url: str
+    cache_dir: str
+    redis_url: Optional[str]  # Optional: share the sectors data across worker processes
+    api_docs: bool  # Serve /docs, /redoc and /openapi.json; turn off in production
+    admin_token: Optional[str] = field(repr=False)  # Required by POST /cache/refresh, which is disabled when unset
+
+    @classmethod
+    def from_env(cls) -> "Settings":
+        return cls(
+            openai_api_key=os.getenv("OPENAI_API_KEY"),
+            model_name=os.getenv("MODEL_NAME", "gpt-4o-mini-2024-07-18"),
+            openai_base_url=os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1"),
+            cache_dir=os.getenv("CACHE_DIR", os.path.join(os.path.dirname(__file__), ".cache")),
+            redis_url=os.getenv("REDIS_URL"),
+            api_docs=os.getenv("API_DOCS", "1").lower() not in ("0", "false", "no"),
+            admin_token=os.getenv("ADMIN_TOKEN") or None,
+        )
+
+
+settings = Settings.from_env()
@@ -1,6 +1,13 @@
 from backend.agents.data_processor import DataProcessorAgent
+import math
 import time
 
+import numpy as np
+import pytest
+
+from backend.agents import data_processor as dp
+from backend.agents.data_processor import FilterProcessor, SectorFrame, StockData, METRIC_INDEX, METRIC_KEYS
+
 agent = DataProcessorAgent(max_workers=5, rate_limit_delay=0.05)
 
 def test_data_processor_agent():
@@ -54,4 +61,197 @@ def test_data_processor_agent():
         print(f"- Elapsed Time: {elapsed_time:.2f} seconds")
 
         assert result["success"] == case["expected_success"]
-        assert len(result["results"]) == case["expected_results_length"]
\ No newline at end of file
+        assert len(result["results"]) == case["expected_results_length"]
+
+
+# ==== Offline tests: synthetic sector frames, no Yahoo or Wikipedia calls ====
+
+
+def make_frame(n=150, seed=0):
+    # Small integer values so filters and sort keys hit plenty of ties, and ~20% missing values
+    rng = np.random.default_rng(seed)
+    columns = {key: np.where(rng.random(n) < 0.2, np.nan, rng.integers(0, 30, n).astype(float)) for key in METRIC_KEYS}
+    return SectorFrame.from_columns(
+        "Energy",
+        symbols=np.array([f"S{i}" for i in range(n)], dtype=object),
+        names=np.array([f"Stock {i}" for i in range(n)], dtype=object),
+        columns=columns,
+    )
+
+
+def reference_filter_and_sort(frame, filters, sort_key, descending=False, limit=None):
+    """Plain-Python screen: every filter must pass (missing never does), then a stable sort with missing as 0."""
+    passing = []
+    for i in range(len(frame)):
+        keep = True
+        for key, value in filters.items():
+            metric, op = key.rsplit("_", 1)
+            if metric not in METRIC_INDEX:
+                return []
+            val = frame.columns[metric][i]
+            if math.isnan(val) or (op == "lt" and not val < value) or (op == "gt" and not val > value) \
+                    or (op == "eq" and val != value):
+                keep = False
+                break
+        if keep:
+            passing.append(i)
+
+    def sort_value(i):
+        val = frame.columns[sort_key][i]
+        val = 0.0 if math.isnan(val) else val
+        return -val if descending else val
+    return sorted(passing, key=sort_value)[:limit]
+
+
+FILTER_CASES = [
+    {},
+    {"peRatio_lt": 15.0},
+    {"price_gt": 10.0, "dividendYield_gt": 0.0},
+    {"peRatio_lt": 25.0, "pbRatio_lt": 12.0, "freeCashFlowYield_gt": 5.0, "price_lt": 20.0},
+    {"marketCap_eq": 7.0},
+    {"price_under": 1.0},  # unsupported operator: only requires the metric to be present
+    {"bogus_lt": 1.0},     # unknown metric: nothing passes
+    {"peRatio_lt": -1.0},  # nothing passes
+]
+
+
+@pytest.fixture(params=["numpy", "numba"])
+def filter_path(request, monkeypatch):
+    if request.param == "numpy":
+        monkeypatch.setattr(dp, "njit", None)
+    elif dp.njit is None:
+        pytest.skip("numba is not installed")
+    return request.param
+
+
+@pytest.mark.parametrize("filters", FILTER_CASES)
+def test_apply_filters_matches_reference(filters):
+    frame = make_frame()
+    expected = reference_filter_and_sort(frame, filters, "price")
+    assert sorted(FilterProcessor.apply_filters(frame, filters).tolist()) == sorted(expected)
+
+
+@pytest.mark.parametrize("filters", FILTER_CASES)
+@pytest.mark.parametrize("sort_key,descending", [("peRatio", False), ("marketCap", True)])
+@pytest.mark.parametrize("limit", [None, 1, 3, 10, 500])
+def test_filter_and_sort_matches_reference(filter_path, filters, sort_key, descending, limit):
+    frame = make_frame()
+    result = FilterProcessor.filter_and_sort(frame, filters, sort_key, descending, limit=limit)
+    assert result.tolist() == reference_filter_and_sort(frame, filters, sort_key, descending, limit)
+
+
+def test_filter_and_sort_keeps_stable_order_for_ties_at_the_cutoff(filter_path):
+    # Equal sort keys straddle the limit: np.partition must not reorder them, lower indices come first
+    frame = SectorFrame.from_stocks("Energy", [
+        StockData(symbol=f"S{i}", name=f"Stock {i}", sector="Energy", price=price)
+        for i, price in enumerate([5.0, 1.0, 3.0, 3.0, 1.0, 3.0, None, 3.0])
+    ])
+    assert FilterProcessor.filter_and_sort(frame, {"price_gt": 0.0}, "price", limit=3).tolist() == [1, 4, 2]
+    assert FilterProcessor.filter_and_sort(frame, {"price_gt": 2.0}, "price", limit=2).tolist() == [2, 3]
+    assert FilterProcessor.filter_and_sort(frame, {"price_gt": 2.0}, "price", descending=True, limit=3).tolist() == [0, 2, 3]
+    # Missing sort values rank as 0
+    assert FilterProcessor.filter_and_sort(frame, {}, "price", limit=2).tolist() == [6, 1]
+
+
+def test_sector_frame_medians_and_stock():
+    frame = SectorFrame.from_stocks("Energy", [
+        StockData(symbol="A", name="A co", sector="Energy", price=10.0, peRatio=None),
+        StockData(symbol="B", name="B co", sector="Energy", price=20.0, peRatio=12.345),
+        StockData(symbol="C", name="C co", sector="Energy", price=40.0, peRatio=None),
+    ])
+    assert frame.medians["price"] == 20.0
+    assert frame.medians["peRatio"] == 12.35
+    assert "pbRatio" not in frame.medians  # all missing
+    assert frame.stock(0) == StockData(symbol="A", name="A co", sector="Energy", price=10.0)
+
+
+def test_npz_round_trip(tmp_path, monkeypatch):
+    sectors = {"Energy": make_frame(40, seed=1), "Utilities": make_frame(7, seed=2), "Empty": make_frame(0)}
+    restored = dp._deserialize_sectors(dp._serialize_sectors(sectors))
+    assert list(restored) == list(sectors)
+    for name, frame in sectors.items():
+        copy = restored[name]
+        assert copy.symbols.tolist() == frame.symbols.tolist()
+        assert copy.names.tolist() == frame.names.tolist()
+        np.testing.assert_array_equal(copy.matrix, frame.matrix)  # NaNs included
+        np.testing.assert_array_equal(copy.sorted_idx, frame.sorted_idx)
+        assert copy.medians == frame.medians
+
+    # Through the cache file: a fresh file is read back instead of fetching
+    monkeypatch.setattr(dp, "SECTORS_CACHE_FILE", str(tmp_path / "sectors.npz"))
+    dp._write_cached_sectors_data(sectors)
+    monkeypatch.setattr(dp, "_load_all_sectors_data", lambda: pytest.fail("fetched despite a fresh cache file"))
+    assert list(dp._load_cached_sectors_data(ttl=3600)) == list(sectors)
+
+
+@pytest.fixture
+def offline_agent(tmp_path, monkeypatch):
+    """A DataProcessorAgent whose loads come from the `loads` list instead of the network."""
+    snapshot = {"Energy": make_frame(20)}
+    loads = [snapshot]
+    monkeypatch.setattr(dp, "SECTORS_CACHE_FILE", str(tmp_path / "sectors.npz"))
+    monkeypatch.setattr(dp, "_make_sector_cache", lambda ttl: None)
+    monkeypatch.setattr(dp.DataProcessorAgent, "_load_sectors_data", lambda self: loads.pop(0))
+    monkeypatch.setattr(dp, "_load_all_sectors_data", lambda: loads.pop(0))
+    agent = dp.DataProcessorAgent(ttl_hours=1)
+    return agent, snapshot, loads
+
+
+def test_refresh_if_stale_reloads_only_when_stale(offline_agent):
+    agent, snapshot, loads = offline_agent
+    fresh = {"Energy": make_frame(20, seed=3)}
+    loads.append(fresh)
+
+    agent.refresh_if_stale()  # not stale yet: nothing loaded
+    assert agent._sectors_data is snapshot and loads == [fresh]
+
+    agent._loaded_at -= 3601
+    agent.refresh_if_stale()
+    assert agent._sectors_data is fresh
+    assert not agent.is_stale
+
+
+def test_refresh_if_stale_keeps_snapshot_when_reload_fails(offline_agent):
+    agent, snapshot, loads = offline_agent
+    loads.append({})  # e.g. Yahoo unreachable
+    agent._loaded_at -= 3601
+
+    agent.refresh_if_stale()
+    assert agent._sectors_data is snapshot
+    # Retried after the short back-off instead of a full ttl_hours
+    assert not agent.is_stale
+    agent._loaded_at -= agent.RELOAD_RETRY_SECONDS + 1
+    assert agent.is_stale
+
+
+def test_refresh_swaps_in_new_data_and_rewrites_the_cache_file(offline_agent):
+    agent, snapshot, loads = offline_agent
+    fresh = {"Energy": make_frame(20, seed=4)}
+    loads.append(fresh)
+
+    assert agent.refresh()
+    assert agent._sectors_data is fresh
+    with open(dp.SECTORS_CACHE_FILE, "rb") as f:
+        np.testing.assert_array_equal(dp._deserialize_sectors(f.read())["Energy"].matrix, fresh["Energy"].matrix)
+
+
+def test_failed_refresh_keeps_the_snapshot_and_the_cache_file(offline_agent):
+    agent, snapshot, loads = offline_agent
+    dp._write_cached_sectors_data(snapshot)
+    with open(dp.SECTORS_CACHE_FILE, "rb") as f:
+        before = f.read()
+    loads.append({})
+
+    assert not agent.refresh()
+    assert agent._sectors_data is snapshot
+    assert not agent.is_stale
+    with open(dp.SECTORS_CACHE_FILE, "rb") as f:
+        assert f.read() == before
+
+
+def test_refresh_is_skipped_while_another_runs(offline_agent):
+    agent, snapshot, loads = offline_agent
+    with agent._refresh_lock:
+        assert agent.is_refreshing
+        assert not agent.refresh()
+    assert agent._sectors_data is snapshot
@@ -1,9 +1,18 @@
-from backend.agents.explanation import ExplanationAgent
+from backend.agents.explanation import ExplanationAgent, ExplanationError
+from backend.config import settings
+import asyncio
 import time
+from types import SimpleNamespace
+from unittest.mock import patch
 
-agent = ExplanationAgent()
+import pytest
+from langchain_core.runnables import RunnableLambda
 
+
+# Calls the real LLM
+@pytest.mark.skipif(not settings.openai_api_key, reason="OPENAI_API_KEY is not set")
 def test_explanation_agent():
+    agent = ExplanationAgent()
 
     test_cases = [
         {
@@ -14,7 +23,7 @@ def test_explanation_agent():
                 'filters': {'price_lt': 250.0, 'dividendYield_gt': 0.0, 'peRatio_lt': 30.0, 'pbRatio_lt': 15.0, 'freeCashFlowYield_gt': 5.0}, 
             },
             'total_found': 69, 'after_filters': 3, 
-            'input': 'Show me 3 undervalued tech stocks under $250 with dividends',
+            'query': 'Show me 3 undervalued tech stocks under $250 with dividends',
             'results': [
                 {'symbol': 'CTSH', 'name': 'Cognizant', 'sector': 'Information Technology', 'peRatio': 16.621052, 'dividendYield': 154.0, 'freeCashFlowYield': 5.104351825608181, 'pbRatio': 2.6124218, 'price': 78.95}, 
                 {'symbol': 'WDC', 'name': 'Western Digital', 'sector': 'Information Technology', 'peRatio': 19.075342, 'dividendYield': 72.0, 'freeCashFlowYield': 7.237229657750918, 'pbRatio': 3.7548876, 'price': 55.7}, 
@@ -27,9 +36,208 @@ def test_explanation_agent():
     for case in test_cases:
         start_time = time.time()
 
-        print(f"\n- Testing query: {case['input']}")
+        print(f"\n- Testing query: {case['query']}")
         explanation = agent.invoke(case)
         print("Explanation:", explanation)
 
         # assert result["success"] == case["expected_success"]
-        # assert len(result["results"]) == case["expected_results_length"]
\ No newline at end of file
+        # assert len(result["results"]) == case["expected_results_length"]
+
+# ==== Offline tests: a stub chain stands in for the LLM ====
+class StubChain:
+    """Counts calls and answers with an explanation built from the query, or raises `error` when set."""
+
+    def __init__(self, error=None):
+        self.calls = 0
+        self.error = error
+
+    def _answer(self, chain_inputs):
+        self.calls += 1
+        if self.error:
+            raise self.error
+        return SimpleNamespace(content=f"Because of {chain_inputs['input']}")
+
+    def invoke(self, chain_inputs):
+        return self._answer(chain_inputs)
+
+    async def ainvoke(self, chain_inputs):
+        return self._answer(chain_inputs)
+
+    def stream(self, chain_inputs):
+        content = self._answer(chain_inputs).content
+        yield SimpleNamespace(content=content[:7])
+        yield SimpleNamespace(content=content[7:])
+
+    async def astream(self, chain_inputs):
+        for chunk in self.stream(chain_inputs):
+            yield chunk
+
+
+def make_inputs(query="cheap energy stocks", symbol="XOM"):
+    return {
+        "query": query,
+        "results": [
+            {"symbol": symbol, "name": "Stock", "sector": "Energy", "peRatio": 12.5},
+            {"symbol": "Sector", "name": "Median", "sector": "Energy", "peRatio": 15.0},
+        ],
+    }
+
+
+def make_agent(chain):
+    # No ChatOpenAI client, so these tests run without an API key
+    with patch("backend.agents.explanation._get_llm", lambda model_name: RunnableLambda(lambda x: x)):
+        agent = ExplanationAgent()
+    agent.chain = chain
+    return agent
+
+
+def test_explanation_cache_hit_and_miss():
+    chain = StubChain()
+    agent = make_agent(chain)
+
+    first = agent.invoke(make_inputs())
+    assert first == "Because of cheap energy stocks" and chain.calls == 1
+    # Same query modulo case/whitespace over the same stocks: served from the cache, by every entry point
+    assert agent.invoke(make_inputs("  Cheap Energy Stocks ")) == first
+    assert asyncio.run(agent.ainvoke(make_inputs())) == first
+    assert "".join(agent.stream(make_inputs())) == first
+    assert chain.calls == 1
+    # Different stocks or a different query: a miss
+    agent.invoke(make_inputs(symbol="CVX"))
+    agent.invoke(make_inputs("high dividend energy stocks"))
+    assert chain.calls == 3
+
+
+def test_streamed_explanation_is_cached_whole():
+    chain = StubChain()
+    agent = make_agent(chain)
+
+    async def collect():
+        return [chunk async for chunk in agent.astream(make_inputs())]
+
+    assert asyncio.run(collect()) == ["Because", " of cheap energy stocks"]
+    assert agent.invoke(make_inputs()) == "Because of cheap energy stocks"
+    assert chain.calls == 1
+
+
+def test_explanation_cache_evicts_least_recently_used(monkeypatch):
+    monkeypatch.setattr(ExplanationAgent, "CACHE_SIZE", 2)
+    chain = StubChain()
+    agent = make_agent(chain)
+
+    agent.invoke(make_inputs("a"))
+    agent.invoke(make_inputs("b"))
+    agent.invoke(make_inputs("a"))  # hit: "a" becomes most recent
+    agent.invoke(make_inputs("c"))  # evicts "b"
+    assert chain.calls == 3
+    agent.invoke(make_inputs("a"))
+    agent.invoke(make_inputs("c"))
+    assert chain.calls == 3
+    agent.invoke(make_inputs("b"))
+    assert chain.calls == 4
+
+
+def test_failed_explanation_is_raised_and_not_cached():
+    chain = StubChain(error=RuntimeError("rate limited"))
+    agent = make_agent(chain)
+
+    with pytest.raises(ExplanationError, match="rate limited"):
+        agent.invoke(make_inputs())
+    with pytest.raises(ExplanationError):
+        asyncio.run(agent.ainvoke(make_inputs()))
+    with pytest.raises(ExplanationError):
+        list(agent.stream(make_inputs()))
+    assert chain.calls == 3
+
+    chain.error = None
+    assert agent.invoke(make_inputs()) == "Because of cheap energy stocks"
+    assert chain.calls == 4
+
+
+def test_bad_inputs_are_not_reported_as_llm_failures():
+    chain = StubChain()
+    agent = make_agent(chain)
+    inputs = make_inputs()
+    inputs["input"] = inputs.pop("query")
+
+    with pytest.raises(KeyError):
+        agent.invoke(inputs)
+    with pytest.raises(KeyError):
+        asyncio.run(agent.ainvoke(inputs))
+    with pytest.raises(KeyError):
+        list(agent.stream(inputs))
+    assert chain.calls == 0
+
+def test_nothing_to_explain_skips_the_llm():
+    chain = StubChain()
+    agent = make_agent(chain)
+
+    assert agent.invoke({"query": "q", "results": [], "error": "Unknown sector"}) == "⚠️ Unknown sector"
+    assert agent.invoke({"query": "q", "results": make_inputs()["results"][-1:]}) == "Not enough data to explain."
+    assert chain.calls == 0
+
+
+class GatedChain(StubChain):
+    """Async stub whose ainvoke() blocks until `release` is set, so concurrent callers overlap."""
+
+    def __init__(self, error=None):
+        super().__init__(error)
+        self.entered = asyncio.Event()
+        self.release = asyncio.Event()
+
+    async def ainvoke(self, chain_inputs):
+        self.entered.set()
+        await self.release.wait()
+        return self._answer(chain_inputs)
+
+
+def test_concurrent_identical_ainvoke_calls_share_one_llm_call():
+    async def scenario():
+        chain = GatedChain()
+        agent = make_agent(chain)
+        tasks = [asyncio.ensure_future(agent.ainvoke(make_inputs())) for _ in range(5)]
+        await chain.entered.wait()
+        assert len(agent._inflight) == 1
+        chain.release.set()
+        results = await asyncio.gather(*tasks)
+        assert results == ["Because of cheap energy stocks"] * 5
+        assert chain.calls == 1
+        assert agent._inflight == {}
+
+    asyncio.run(scenario())
+
+
+def test_cancelling_one_waiter_does_not_cancel_the_shared_call():
+    async def scenario():
+        chain = GatedChain()
+        agent = make_agent(chain)
+        cancelled, *others = [asyncio.ensure_future(agent.ainvoke(make_inputs())) for _ in range(3)]
+        await chain.entered.wait()
+        cancelled.cancel()
+        await asyncio.sleep(0)
+        chain.release.set()
+        assert await asyncio.gather(*others) == ["Because of cheap energy stocks"] * 2
+        assert cancelled.cancelled()
+        assert chain.calls == 1
+
+    asyncio.run(scenario())
+
+
+def test_failed_shared_call_reaches_every_waiter_and_clears_inflight():
+    async def scenario():
+        chain = GatedChain(error=RuntimeError("timeout"))
+        agent = make_agent(chain)
+        tasks = [asyncio.ensure_future(agent.ainvoke(make_inputs())) for _ in range(3)]
+        await chain.entered.wait()
+        chain.release.set()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        assert all(isinstance(r, ExplanationError) for r in results)
+        assert chain.calls == 1
+        assert agent._inflight == {}
+
+        # The next request starts a fresh call rather than joining the failed one
+        chain.error = None
+        assert await agent.ainvoke(make_inputs()) == "Because of cheap energy stocks"
+        assert chain.calls == 2
+
+    asyncio.run(scenario())
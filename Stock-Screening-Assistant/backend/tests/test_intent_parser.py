@@ -1,5 +1,14 @@
 # test_intent_parser.py
-from backend.agents.intent_parser import IntentParserAgent
+import asyncio
+import re
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import orjson
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+
+from backend.agents.intent_parser import IntentParserAgent, _SECTOR_HINT_RE, _fast_parse
 
 
 def test_intent_parser_agent():
@@ -59,4 +68,176 @@ def test_intent_parser_agent():
         else:
             assert result["intent"]["sector"] == case["expected"]["sector"]
             if "filters" in case["expected"]:
-                assert result["intent"]["filters"] == case["expected"]["filters"]
\ No newline at end of file
+                assert result["intent"]["filters"] == case["expected"]["filters"]
+
+
+def test_fast_parse():
+    # Template-like queries are parsed without the LLM
+    intent = _fast_parse("Show me 3 undervalued tech stocks under $150 with dividends")
+    assert intent["sector"] == "tech"
+    assert intent["limit"] == 3
+    assert intent["filters"] == {
+        "peRatio_lt": 25.0, "pbRatio_lt": 12.0, "freeCashFlowYield_gt": 0.05,
+        "dividendYield_gt": 0.0, "price_lt": 150.0,
+    }
+    assert _fast_parse("Top 5 high dividend REITs")["filters"] == {"dividendYield_gt": 4.0}
+    assert _fast_parse("under $50 energy stocks")["limit"] is None
+
+    # Anything not fully understood goes to the LLM
+    for query in [
+        "Give me safe stocks under $50",                  # no sector
+        "Top healthcare stocks with revenue growth > 10",  # explicit metric
+        "Find stocks in luxury sector under $200",         # unknown sector
+        "tech stocks with P/E under 20",
+        "How about energy stocks?",
+    ]:
+        assert _fast_parse(query) is None, query
+
+
+def test_sector_hint():
+    # Queries without any sector hint skip the LLM and get the missing-sector clarification
+    assert not _SECTOR_HINT_RE.search("Give me safe stocks under $50")
+    assert not _SECTOR_HINT_RE.search("Top 5 high dividend stocks")
+    for query in [
+        "Show me 3 undervalued tech stocks",
+        "Top 5 high dividend REITs",
+        "Find stocks in luxury sector under $200",  # still sent to the LLM for the invalid-sector error
+        "cheap bank stocks",
+        "Best Information Technology stocks",
+    ]:
+        assert _SECTOR_HINT_RE.search(query), query
+
+
+# ==== Offline batch_invoke tests: stub LLMs answer from a table instead of calling OpenAI ====
+LLM_INTENTS = {
+    "Top healthcare stocks with revenue growth > 10": {"sector": "healthcare", "filters": {"revenueGrowth_gt": 10}},
+    "Find stocks in luxury sector under $200": {"sector": "luxury", "filters": {"price_lt": 200}},
+    "tech stocks with P/E under 20": {"sector": "technology", "filters": {"peRatio_lt": 20}},
+    "How about utilities stocks?": {"sector": "utilities"},
+    "Energy stocks with strong balance sheets": {"intent": "screen", "sector": "Energy"},  # legacy key
+}
+
+
+class StubLLM:
+    """Answers the numbered batch prompt (via bind()) and single prompts (via `single`) from LLM_INTENTS."""
+
+    def __init__(self, drop_last=False):
+        self.batch_calls = []
+        self.single_calls = []
+        self.drop_last = drop_last  # return one intent too few
+
+    def bind(self, **kwargs):
+        return RunnableLambda(self._batch)
+
+    def _batch(self, prompt_value):
+        queries = re.findall(r"^\[\d+\] (.*)$", prompt_value.to_messages()[-1].content, re.M)
+        self.batch_calls.append(queries)
+        intents = [LLM_INTENTS[q] for q in queries]
+        return AIMessage(content=orjson.dumps({"intents": intents[:-1] if self.drop_last else intents}).decode())
+
+    def single(self, inputs):
+        query = inputs["messages"][-1].content.splitlines()[1]
+        self.single_calls.append(query)
+        return AIMessage(content=orjson.dumps(LLM_INTENTS[query]).decode())
+
+
+def make_stub_agent(**kwargs):
+    # No ChatOpenAI client, so these tests run without an API key
+    with patch("backend.agents.intent_parser._get_llm", lambda model_name: RunnableLambda(lambda x: x)):
+        agent = IntentParserAgent()
+    agent.llm = StubLLM(**kwargs)
+    agent.chain = RunnableLambda(agent.llm.single)
+    return agent
+
+
+def test_batch_invoke_mixes_fast_path_and_one_llm_call_in_order():
+    agent = make_stub_agent()
+    queries = [
+        "Top healthcare stocks with revenue growth > 10",            # LLM
+        "Show me 3 undervalued tech stocks under $150 with dividends",  # fast path
+        "Find stocks in luxury sector under $200",                   # LLM, then invalid sector
+        "Give me safe stocks under $50",                             # no sector hint: no LLM
+        "tech stocks with P/E under 20",                             # LLM
+    ]
+    results = agent.batch_invoke(queries)
+
+    assert agent.llm.batch_calls == [[queries[0], queries[2], queries[4]]]
+    assert agent.llm.single_calls == []
+    assert [r["query"] for r in results] == queries
+    assert results == [agent.invoke({"query": q}) for q in queries]  # same answers as one by one, now from the cache
+    assert results[0]["intent"]["filters"] == {"revenueGrowth_gt": 10}
+    assert results[1]["intent"]["limit"] == 3
+    assert results[2]["clarification_needed"] and "luxury" in results[2]["error"]
+    assert results[3]["clarification_needed"] and results[3]["error"].startswith("Missing sector")
+    assert results[4]["intent"]["filters"] == {"peRatio_lt": 20}
+    assert len(agent.llm.batch_calls) == 1 and agent.llm.single_calls == []
+
+
+def test_batch_invoke_applies_context_per_query():
+    agent = make_stub_agent()
+    context = {"sector": "Energy", "limit": 5, "metrics": ["dividendYield"], "filters": {"dividendYield_gt": 3.0}}
+    results = agent.batch_invoke(["How about utilities stocks?", "tech stocks with P/E under 20"], context)
+
+    assert agent.llm.batch_calls == [["How about utilities stocks?", "tech stocks with P/E under 20"]]
+    # A follow-up without filters inherits them from the context, one with its own filters keeps them
+    assert results[0]["intent"]["filters"] == {"dividendYield_gt": 3.0}
+    assert results[0]["intent"]["limit"] == 5
+    assert results[0]["intent"]["metrics"] == ["dividendYield", "price", "peRatio"]
+    assert results[1]["intent"]["filters"] == {"peRatio_lt": 20}
+    assert results[1]["intent"]["limit"] is None
+
+
+def test_batch_invoke_single_pending_query_uses_invoke():
+    agent = make_stub_agent()
+    results = agent.batch_invoke(["under $50 energy stocks", "tech stocks with P/E under 20"])
+
+    assert agent.llm.batch_calls == []
+    assert agent.llm.single_calls == ["tech stocks with P/E under 20"]
+    assert results[0]["intent"]["filters"] == {"price_lt": 50.0}
+    assert results[1]["intent"]["filters"] == {"peRatio_lt": 20}
+
+
+def test_batch_invoke_falls_back_to_single_queries_on_bad_batch():
+    agent = make_stub_agent(drop_last=True)
+    queries = ["Top healthcare stocks with revenue growth > 10", "tech stocks with P/E under 20"]
+    results = agent.batch_invoke(queries)
+
+    assert len(agent.llm.batch_calls) == 1
+    assert agent.llm.single_calls == queries
+    assert [r["intent"]["filters"] for r in results] == [{"revenueGrowth_gt": 10}, {"peRatio_lt": 20}]
+
+
+def test_extra_keys_in_llm_output_are_ignored():
+    query = "Energy stocks with strong balance sheets"
+    expected = {"sector": "Energy", "limit": None, "metrics": ["price", "peRatio"], "filters": {}}
+
+    agent = make_stub_agent()
+    assert agent.invoke({"query": query})["intent"] == expected
+    agent = make_stub_agent()
+    assert asyncio.run(agent.ainvoke({"query": query}))["intent"] == expected
+    assert agent.llm.single_calls == [query]
+    agent = make_stub_agent()
+    results = agent.batch_invoke([query, "tech stocks with P/E under 20"])
+    assert results[0]["intent"] == expected
+    assert len(agent.llm.batch_calls) == 1 and agent.llm.single_calls == []
+
+
+def test_ainvoke_closes_the_llm_stream_after_an_early_stop():
+    agent = make_stub_agent()
+    closed = []
+
+    async def astream(inputs):
+        try:
+            yield AIMessage(content='{"sector": "Energy"}')
+            yield AIMessage(content="  trailing tokens")
+        finally:
+            closed.append(True)
+    agent.chain = SimpleNamespace(astream=astream)
+
+    async def scenario():
+        result = await agent.ainvoke({"query": "Energy stocks with strong balance sheets"})
+        # Closed by ainvoke itself, not later when asyncio.run() finalizes leftover generators
+        assert closed == [True]
+        return result
+
+    assert asyncio.run(scenario())["intent"]["sector"] == "Energy"
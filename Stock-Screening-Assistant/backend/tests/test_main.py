@@ -1,5 +1,12 @@
 # tests/test_main.py
+import json
+from collections import OrderedDict
+from dataclasses import replace
+from types import SimpleNamespace
+
+import pytest
 from fastapi.testclient import TestClient
+from backend.api import main
 from backend.api.main import app
 
 client = TestClient(app)
@@ -55,3 +62,163 @@ def test_screen_unsupported_intent():
     assert response.status_code == 400
     assert "Unsupported intent" in response.json()["error"]
 
+
+
+# ==== Offline API tests: a fake inter_agent_chain stands in for the agents ====
+INTENT = {"sector": "Energy", "limit": 2, "metrics": ["price", "peRatio"], "filters": {"peRatio_lt": 15.0}}
+RESULTS = [{"symbol": "XOM", "name": "Exxon", "price": 110.0}, {"symbol": "Sector", "name": "Median", "price": 90.0}]
+ANSWER = {"intent": INTENT, "results": RESULTS, "explanation": "XOM is cheap."}
+CLARIFICATION = {"short_circuit": True, "error": "Missing sector in query.", "parsed": {}}
+FAILED = {**ANSWER, "explanation": "Failed to generate explanation: timeout", "explanation_failed": True}
+
+
+class FakeChain:
+    """Records the inputs of each call and answers with `result` (ainvoke) or `events` (astream)."""
+
+    def __init__(self, result=ANSWER, events=None):
+        self.calls = []
+        self.result = result
+        self.events = events if events is not None else [
+            ("intent", INTENT), ("results", RESULTS), ("explanation_delta", "XOM is "), ("explanation_delta", "cheap."),
+        ]
+
+    async def ainvoke(self, inputs):
+        self.calls.append(inputs)
+        return self.result
+
+    async def astream(self, inputs):
+        self.calls.append(inputs)
+        for event in self.events:
+            yield event
+
+
+@pytest.fixture
+def chain(monkeypatch):
+    fake = FakeChain()
+    monkeypatch.setattr(main, "inter_agent_chain", fake)
+    monkeypatch.setattr(main, "_response_cache", OrderedDict())
+    monkeypatch.setattr(main, "_session_intents", OrderedDict())
+    return fake
+
+
+def parse_sse(text):
+    events = []
+    for block in text.strip().split("\n\n"):
+        event_line, data_line = block.split("\n")
+        events.append((event_line.removeprefix("event: "), json.loads(data_line.removeprefix("data: "))))
+    return events
+
+
+def test_query_caches_complete_answers(chain):
+    first = client.post("/query", json={"query": "Cheap energy stocks"})
+    assert first.status_code == 200 and first.headers["X-Cache"] == "MISS"
+    assert first.json() == {"success": True, **ANSWER}
+
+    second = client.post("/query", json={"query": "  cheap ENERGY stocks "})
+    assert second.headers["X-Cache"] == "HIT"
+    assert second.json() == first.json()
+    assert len(chain.calls) == 1
+
+    # A different context is a different answer
+    client.post("/query", json={"query": "Cheap energy stocks", "context_intent": INTENT})
+    assert len(chain.calls) == 2
+
+
+@pytest.mark.parametrize("result", [CLARIFICATION, FAILED], ids=["clarification", "failed_explanation"])
+def test_query_does_not_cache_incomplete_answers(chain, result):
+    chain.result = result
+    for _ in range(2):
+        response = client.post("/query", json={"query": "stocks"})
+        assert response.headers["X-Cache"] == "MISS"
+    assert len(chain.calls) == 2
+    body = response.json()
+    if result is FAILED:
+        assert body["success"] and body["explanation_failed"]
+    else:
+        assert body == {"success": False, "clarification_needed": True, "error": "Missing sector in query.", "parsed_intent": {}}
+
+
+def test_session_memory_supplies_the_context_intent(chain):
+    client.post("/query", json={"query": "Cheap energy stocks", "session_id": "s1"})
+    client.post("/query", json={"query": "How about utilities?", "session_id": "s1"})
+    client.post("/query", json={"query": "How about utilities?", "session_id": "s2"})
+    client.post("/query", json={"query": "How about banks?", "session_id": "s1", "context_intent": {"sector": "Financials"}})
+    assert [call["context_intent"] for call in chain.calls] == [{}, INTENT, {}, {"sector": "Financials"}]
+
+    # Clarifications leave the remembered intent alone
+    chain.result = CLARIFICATION
+    client.post("/query", json={"query": "Safe stocks", "session_id": "s1"})
+    assert main._session_intents["s1"] == INTENT
+
+
+def test_query_stream_events_and_caching(chain):
+    response = client.post("/query/stream", json={"query": "Cheap energy stocks", "session_id": "s1"})
+    assert response.headers["X-Cache"] == "MISS"
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert parse_sse(response.text) == [
+        ("intent", INTENT), ("results", RESULTS),
+        ("explanation_delta", {"text": "XOM is "}), ("explanation_delta", {"text": "cheap."}),
+        ("done", {"success": True, "explanation_failed": False}),
+    ]
+    assert main._session_intents["s1"] == INTENT
+
+    # The completed stream filled the cache shared with /query
+    cached = client.post("/query", json={"query": "Cheap energy stocks"})
+    assert cached.headers["X-Cache"] == "HIT"
+    assert cached.json()["explanation"] == "XOM is cheap."
+    replay = client.post("/query/stream", json={"query": "Cheap energy stocks"})
+    assert replay.headers["X-Cache"] == "HIT"
+    assert parse_sse(replay.text)[2:] == [
+        ("explanation_delta", {"text": "XOM is cheap."}), ("done", {"success": True, "explanation_failed": False}),
+    ]
+    assert len(chain.calls) == 1
+
+
+def test_query_stream_does_not_cache_failed_explanations(chain):
+    chain.events = [("intent", INTENT), ("results", RESULTS), ("explanation_delta", "XOM"),
+                    ("explanation_error", "Failed to generate explanation: timeout")]
+    events = parse_sse(client.post("/query/stream", json={"query": "Cheap energy stocks"}).text)
+    assert events[-2:] == [
+        ("explanation_error", {"detail": "Failed to generate explanation: timeout"}),
+        ("done", {"success": True, "explanation_failed": True}),
+    ]
+    assert client.post("/query/stream", json={"query": "Cheap energy stocks"}).headers["X-Cache"] == "MISS"
+
+
+def test_query_stream_clarification(chain):
+    chain.events = [("clarification", CLARIFICATION)]
+    response = client.post("/query/stream", json={"query": "Safe stocks", "session_id": "s1"})
+    assert parse_sse(response.text) == [("clarification", {
+        "success": False, "clarification_needed": True, "error": "Missing sector in query.", "parsed_intent": {},
+    })]
+    assert main._response_cache == {} and main._session_intents == {}
+
+
+def test_cache_refresh_requires_the_admin_token(chain, monkeypatch):
+    processor = SimpleNamespace(is_refreshing=False, refreshes=0)
+
+    def refresh():
+        processor.refreshes += 1
+        return True
+    processor.refresh = refresh
+    monkeypatch.setattr(main, "data_processor", processor)
+
+    # No token configured: the endpoint is disabled
+    monkeypatch.setattr(main, "settings", replace(main.settings, admin_token=None))
+    assert client.post("/cache/refresh", headers={"X-Admin-Token": ""}).status_code == 403
+
+    monkeypatch.setattr(main, "settings", replace(main.settings, admin_token="s3cret"))
+    assert client.post("/cache/refresh").status_code == 403
+    assert client.post("/cache/refresh", headers={"X-Admin-Token": "wrong"}).status_code == 403
+    assert processor.refreshes == 0
+
+    client.post("/query", json={"query": "Cheap energy stocks"})
+    response = client.post("/cache/refresh", headers={"X-Admin-Token": "s3cret"})
+    assert response.status_code == 202 and response.json() == {"status": "refreshing"}
+    assert processor.refreshes == 1  # the background task runs once the response is sent
+    assert main._response_cache == {}
+
+    processor.is_refreshing = True
+    response = client.post("/cache/refresh", headers={"X-Admin-Token": "s3cret"})
+    assert response.json() == {"status": "already refreshing"}
+    assert processor.refreshes == 1
@@ -1,10 +1,15 @@
 import streamlit as st
 import requests
-from st_aggrid import AgGrid, GridOptionsBuilder, ColumnsAutoSizeMode
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from st_aggrid import AgGrid, GridOptionsBuilder, ColumnsAutoSizeMode, GridUpdateMode
 import pandas as pd
 import time
 import re
+import json
 import logging
+import os
+import uuid
 
 # Configure logging
 logging.basicConfig(
@@ -29,27 +34,71 @@ st.markdown("""
 
 # Constants
 BACKEND_URL = "http://localhost:8000"
+# Seconds to wait for the backend's answer. The default covers the worst case, where the backend first
+# reloads stale sectors data from Yahoo (minutes) and then runs the LLM parse and explanation.
+BACKEND_READ_TIMEOUT = float(os.getenv("BACKEND_READ_TIMEOUT", "600"))
+_DOLLAR_RE = re.compile(r'(?<!\$)\$(?!\$)')  # a single $, not part of a $$ pair
 
 
 # --- Helper Functions ---
-def send_query_to_backend(query_text, context_intent=None):
+# Streamlit re-runs this script on every interaction, so the session is kept in cache_resource
+# to reuse its keep-alive connection to the backend across submissions
+@st.cache_resource
+def get_http_session():
+    session = requests.Session()
+    # Small pool shared by Streamlit's script threads; retries cover a backend restart, not a slow query
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=Retry(total=2, backoff_factor=0.2))
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+class _UncachedResponse(Exception):
+    """Carries a backend answer out of _cached_query without st.cache_data storing it."""
+
+    def __init__(self, body):
+        super().__init__("uncached backend response")
+        self.body = body
+
+
+# Responses cached per (query, context intent, session) for 5 minutes, so a resubmitted query skips the backend.
+# context_intent arrives as sorted-key JSON to make a stable, hashable cache key.
+@st.cache_data(ttl=300, show_spinner=False)
+def _cached_query(query_text, context_intent_json, session_id):
+    # The backend remembers the last intent per session_id; an explicit context_intent still wins
+    payload = {"query": query_text, "session_id": session_id}
+    context_intent = json.loads(context_intent_json)
+    if context_intent: # from the second query, we can pass along the intent from the previous query
+        payload["context_intent"] = context_intent
+    logger.info(f"Sending query to backend: {f"{BACKEND_URL}/query"}")
+    # (connect, read) timeouts: fail fast when the backend is down, wait out a slow answer otherwise
+    response = get_http_session().post(f"{BACKEND_URL}/query", json=payload, timeout=(3, BACKEND_READ_TIMEOUT))
+    response.raise_for_status()  # raised, not returned, so errors are not cached
+    body = response.json()
+    # Clarifications and failed explanations may differ on retry, so they are raised past the cache too
+    if not body.get("success") or body.get("explanation_failed"):
+        raise _UncachedResponse(body)
+    return body
+
+
+def send_query_to_backend(query_text, context_intent=None, session_id=None):
     try:
-        payload = {"query": query_text}
-        if context_intent: # from the second query, we can pass along the intent from the previous query
-            payload["context_intent"] = context_intent
-        logger.info(f"Sending query to backend: {f"{BACKEND_URL}/query"}")
-        response = requests.post(f"{BACKEND_URL}/query", json=payload) 
-        return response.json() if response.status_code == 200 else {"error": f"Backend error: {response.text}"}
+        return _cached_query(query_text, json.dumps(context_intent or {}, sort_keys=True), session_id)
+    except _UncachedResponse as e:
+        return e.body
+    except requests.HTTPError as e:
+        return {"error": f"Backend error: {e.response.text}"}
     except Exception as e:
         return {"error": str(e)}
 
 
-def render_aggrid_table(df):
+def render_aggrid_table(df, key):
     gb = GridOptionsBuilder.from_dataframe(df)
     gb.configure_pagination(enabled=False)
     gb.configure_side_bar()
     gb.configure_selection(selection_mode="single", use_checkbox=False)
-    gb.configure_default_column(autoSizeStrategy={'type': 'fitCellContents', 'skipHeader': False})
+    # Columns share the grid width instead of being sized by measuring every rendered cell; users can still drag to resize
+    gb.configure_default_column(resizable=True)
     grid_options = gb.build()
 
     AgGrid(
@@ -59,12 +108,51 @@ def render_aggrid_table(df):
         theme='streamlit',
         height=160,  #217,
         width=None,
-        update_mode='MODEL_CHANGED',
+        # Read-only result tables: a stable key and NO_UPDATE keep the grid from re-sending its data on every rerun
+        update_mode=GridUpdateMode.NO_UPDATE,
+        key=key,
         allowSorting=True,
-        columns_auto_size_mode=ColumnsAutoSizeMode.FIT_CONTENTS
+        columns_auto_size_mode=ColumnsAutoSizeMode.FIT_ALL_COLUMNS_TO_VIEW
     )
 
 
+# Backend field names -> table headers
+_COLUMN_RENAME = {
+    'peRatio': 'P/E Ratio',
+    'pbRatio': 'P/B Ratio',
+    'dividendYield': 'Dividend Yield',
+    'debtToEquity': 'Debt to Equity',
+    'revenueGrowth': 'Revenue Growth',
+    'freeCashFlowYield': 'Free Cash Flow Yield',
+    'price': 'Price',
+    'sector': 'Sector',
+    'marketCap': 'Market Cap',
+    'symbol': 'Symbol',
+    'name': 'Company Name',
+}
+
+
+def format_results_df(results):
+    df = pd.DataFrame(results)
+    df.rename(columns=_COLUMN_RENAME, inplace=True)
+
+    # Define which columns should be shown as percentages (whole columns at a time, not cell by cell)
+    pct_columns = df.columns.intersection(['Revenue Growth', 'Free Cash Flow Yield'])
+    pct_columns2 = df.columns.intersection(['Dividend Yield']) # already in percentage format, just need to append '%'
+    float_columns = df.select_dtypes(include='float').columns.difference(pct_columns.union(pct_columns2))
+
+    for col in pct_columns:
+        # Convert decimal to percentage string with one decimal place; missing values stay blank
+        values = pd.to_numeric(df[col], errors='coerce')
+        df[col] = (values * 100).map('{:.1f}%'.format).where(values.notna(), "")
+    for col in pct_columns2:
+        values = pd.to_numeric(df[col], errors='coerce')
+        df[col] = (values.astype(str) + '%').where(values.notna(), "")
+    # Round regular float columns to 2 decimals
+    df[float_columns] = df[float_columns].round(2)
+    return df
+
+
 # --- Main App UI ---
 st.title("📈 Stock Screening Assistant")
 
@@ -73,6 +161,12 @@ if 'chat_history' not in st.session_state:
     st.session_state['chat_history'] = []
 if 'last_intent' not in st.session_state:
     st.session_state.last_intent = None
+if 'session_id' not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex  # one per browser session
+
+with st.sidebar:
+    if st.button("Clear cache"):
+        _cached_query.clear()
 
 # Input section
 with st.form(key='user_input_form', clear_on_submit=True):
@@ -94,16 +188,23 @@ if submit_button and user_input.strip():
     start_time = time.time()  # Start timing before sending request
     with spinner_placeholder:
         with st.spinner("Processing your query..."):
-            screen_response = send_query_to_backend(user_input, st.session_state.last_intent)
+            screen_response = send_query_to_backend(user_input, st.session_state.last_intent, st.session_state.session_id)
     end_time = time.time()  # End timing after receiving response
     elapsed_time = round(end_time - start_time, 2)  # Rounded to 2 decimals
 
+    # Past entries never change, so the table and explanation are prepared once here
+    # rather than rebuilt for every chat on every Streamlit rerun
+    results = screen_response.get('results')
+    explanation = screen_response.get('explanation', '')
+
     # Insert at the beginning to show latest query first
     st.session_state.chat_history.insert(0, {
         "query": user_input,
         "screen_response": screen_response,
         "timestamp": start_time,
-        "elapsed_time": elapsed_time
+        "elapsed_time": elapsed_time,
+        "df": format_results_df(results) if results else None,
+        "safe_explanation": _DOLLAR_RE.sub('&#36;', explanation) if explanation else '',  # Escape single $ signs to avoid Markdown formatting issues
     })
 
     # Save intent for future follow-up queries
@@ -131,48 +232,16 @@ for idx, chat in enumerate(st.session_state['chat_history']):
         #     st.error(response['error'])
 
         elif 'results' in response:
-            intent = response.get('intent', {})
             results = response.get('results', [])
-            explanation = response.get('explanation', '')
-            safe_explanation = re.sub(r'(?<!\$)\$(?!\$)', '&#36;', explanation)  # Escape single $ signs to avoid Markdown formatting issues
-
-            if results:
-                df = pd.DataFrame(results)
-                df.rename(columns={
-                    'peRatio': 'P/E Ratio',
-                    'pbRatio': 'P/B Ratio',
-                    'dividendYield': 'Dividend Yield',
-                    'debtToEquity': 'Debt to Equity',
-                    'revenueGrowth': 'Revenue Growth',
-                    'freeCashFlowYield': 'Free Cash Flow Yield',
-                    'price': 'Price',
-                    'sector': 'Sector',
-                    'marketCap': 'Market Cap',
-                    'symbol': 'Symbol',
-                    'name': 'Company Name',
-                }, inplace=True)
-
-                # Define which columns should be shown as percentages
-                pct_columns = ['Revenue Growth', 'Free Cash Flow Yield']
-                pct_columns2 = ['Dividend Yield'] # already in percentage format, just need to append '%'
-
-                for col in df.columns:
-                    if col in pct_columns:
-                        # Convert decimal to percentage string with one decimal place
-                        df[col] = df[col].apply(lambda x: f"{x * 100:.1f}%" if pd.notna(x) and isinstance(x, (int, float)) else "")
-                    elif col in pct_columns2:
-                        # Convert decimal to percentage string with one decimal place
-                        df[col] = df[col].apply(lambda x: f"{x}%" if pd.notna(x) and isinstance(x, (int, float)) else "")
-                    elif pd.api.types.is_float_dtype(df[col]):
-                        # Round regular float columns to 2 decimals
-                        df[col] = df[col].round(2)
+            df = chat.get('df')  # prepared once in the submit handler
 
+            if df is not None:
                 st.markdown("**📊 Matching Stocks:**")
-                render_aggrid_table(df)
+                render_aggrid_table(df, key=f"ag-{chat['timestamp']}")  # per entry; idx shifts as new chats are inserted first
                 logger.info(f"Successfully displayed {len(results)-1} matching stocks.")
 
-            if explanation:
-                st.markdown(f"<div class='chat-bubble'><b>🤖 Stock Screening Assistant:</b><br>{safe_explanation}</div>", unsafe_allow_html=True)
+            if chat.get('safe_explanation'):
+                st.markdown(f"<div class='chat-bubble'><b>🤖 Stock Screening Assistant:</b><br>{chat['safe_explanation']}</div>", unsafe_allow_html=True)
         else:
             st.warning("Unexpected response structure.")
     except Exception as e:
@@ -1,4 +1,5 @@
 from typing import Dict, Any
+from concurrent.futures import ThreadPoolExecutor
 from app.graph.state import AgentState
 from app.tools.database_tools import get_product_info, get_historical_sales, get_supplier_info
 from app.tools.forecast_tools import get_baseline_forecast
@@ -6,6 +7,9 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# The four lookups below are independent, IO-bound database queries, so they run side by side
+_TOOL_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="data-analyst")
+
 def data_analyst_agent(state: AgentState) -> AgentState:
     """
     Data Analyst Agent: Gathers product information, inventory, and generates baseline forecast.
@@ -15,28 +19,34 @@ def data_analyst_agent(state: AgentState) -> AgentState:
     updates = {}
     
     try:
+        # Dispatch all lookups at once; the forecaster reads sales itself, so it does not wait on the query below
+        product_future = _TOOL_POOL.submit(get_product_info.invoke, {"product_code": state.product_code})
+        supplier_future = _TOOL_POOL.submit(get_supplier_info.invoke, {"product_code": state.product_code})
+        historical_future = _TOOL_POOL.submit(get_historical_sales.invoke, {"product_code": state.product_code, "days": 14})
+        forecast_future = _TOOL_POOL.submit(get_baseline_forecast.invoke, {
+            "product_code": state.product_code, 
+            "forecast_days": state.forecast_days
+        })
+
         # Get product and inventory info
-        product_result = get_product_info.invoke({"product_code": state.product_code})
+        product_result = product_future.result()
         if product_result.get("success"):
             updates["product_info"] = product_result
         
         # Get supplier information
-        supplier_result = get_supplier_info.invoke({"product_code": state.product_code})
+        supplier_result = supplier_future.result()
         if supplier_result.get("success") and supplier_result.get("suppliers"):
             updates["supplier_info"] = supplier_result.get("suppliers")
         
         # Get 2 weeks of historical sales data for reference
-        historical_result = get_historical_sales.invoke({"product_code": state.product_code, "days": 14})
+        historical_result = historical_future.result()
         
         if historical_result.get("success"):            
             updates["historical_sales_data"] = historical_result.get("sales_data", [])
             logger.info(f"Retrieved {len(historical_result['sales_data'])} historical sales records")
 
         # Get baseline forecast
-        forecast_result = get_baseline_forecast.invoke({
-            "product_code": state.product_code, 
-            "forecast_days": state.forecast_days
-        })
+        forecast_result = forecast_future.result()
         # logger.info(f"* Baseline forecast retrieved: \n{forecast_result}")
         if forecast_result.get("success"):
             # Calculate total predicted demand
@@ -53,11 +63,11 @@ def data_analyst_agent(state: AgentState) -> AgentState:
             updates["baseline_forecast"] = forecast_data
         
         updates["current_step"] = "data_analysis_complete"
-        updates["errors"] = state.errors  # Preserve existing errors
+        updates["errors"] = []  # No new errors; the state reducer keeps the existing ones
         
     except Exception as e:
         error_msg = f"Data Analyst error: {str(e)}"
         logger.error(error_msg)
-        updates["errors"] = state.errors + [error_msg]
+        updates["errors"] = [error_msg]
     
     return updates
\ No newline at end of file
@@ -14,20 +14,23 @@ def reporter_agent(state: AgentState) -> Dict[str, Any]:
     updates = {}
     
     try:
+        # Dump the state once for the report tools; neither reads the raw sales history
+        state_dict = state.model_dump(exclude={"historical_sales_data"})
+
         # Generate executive summary
-        summary = generate_executive_summary.invoke({"state": state.model_dump()})
+        summary = generate_executive_summary.invoke({"state": state_dict})
         updates["executive_summary"] = summary
         
         # Create PDF report
-        # report_data = create_pdf_report.invoke({"state": state.model_dump()})
+        # report_data = create_pdf_report.invoke({"state": state_dict})
         # updates["report_data"] = report_data
         
         updates["current_step"] = "report_complete"
-        updates["errors"] = state.errors
+        updates["errors"] = []  # No new errors; the state reducer keeps the existing ones
         
     except Exception as e:
         error_msg = f"Reporter error: {str(e)}"
         logger.error(error_msg)
-        updates["errors"] = state.errors + [error_msg]
+        updates["errors"] = [error_msg]
     
     return updates  # state.copy(update=updates)
\ No newline at end of file
@@ -1,12 +1,14 @@
-from app.graph.state import AgentState, Recommendation
+from app.graph.state import AgentState, Recommendation, RecommendationDecision
 from langchain_openai import ChatOpenAI
 from langchain.schema import HumanMessage, SystemMessage
 import logging
-import json
 from dotenv import load_dotenv
 import os
-import re
-from typing import Dict, Any
+import time
+import sqlite3
+import hashlib
+from contextlib import closing
+from typing import Dict, Any, Optional
 
 logger = logging.getLogger(__name__)
 # Load environment variables from .env file
@@ -14,12 +16,25 @@ load_dotenv()   # .env is at the project root
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 GPT_MODEL = os.getenv("GPT_MODEL", "gpt-4o-mini-2024-07-18")
 
+# Persistent cache of LLM recommendations: the prompt is fixed apart from the decision context and
+# runs at temperature 0.1, so reruns and retries on the same data can reuse the last answer.
+# Bump PROMPT_VERSION whenever the prompt in get_llm_recommendation changes.
+PROMPT_VERSION = "v3"
+# Under the project root rather than the working directory, so every entry point shares one (git-ignored) file
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", os.path.join(PROJECT_ROOT, ".cache", "llm_cache.sqlite3"))
+LLM_CACHE_TTL = 24 * 3600  # seconds
+
 # Initialize LLM
 llm = ChatOpenAI(
     temperature=0.1, 
     model=GPT_MODEL,
     openai_api_key=OPENAI_API_KEY
 )
+# The API returns JSON matching the RecommendationDecision schema and LangChain parses it,
+# so there is no JSON to dig out of a Markdown reply. Every field is required, so a missing
+# one fails validation instead of being filled with a default.
+structured_llm = llm.with_structured_output(RecommendationDecision, method="json_schema")
 
 def supply_commander_agent(state: AgentState) -> Dict[str, Any]:
     """
@@ -40,12 +55,12 @@ def supply_commander_agent(state: AgentState) -> Dict[str, Any]:
         
         updates["recommendation"] = recommendation.model_dump()
         updates["current_step"] = "decision_complete"
-        updates["errors"] = state.errors
+        updates["errors"] = []  # No new errors; the state reducer keeps the existing ones
         
     except Exception as e:
         error_msg = f"Supply Commander error: {str(e)}"
         logger.error(error_msg)
-        updates["errors"] = state.errors + [error_msg]
+        updates["errors"] = [error_msg]
     
     return updates  # state.copy(update=updates)
 
@@ -74,6 +89,33 @@ def prepare_decision_context(state: AgentState) -> str:
 
     return "\n".join(context_parts)
 
+def _llm_cache_key(context: str, product_code: str) -> str:
+    # product_code is part of the key, so two products never share a decision even if their contexts render alike
+    return hashlib.sha256(f"{GPT_MODEL}|{PROMPT_VERSION}|{product_code}|{context}".encode()).hexdigest()
+
+def _llm_cache_connect() -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(LLM_CACHE_PATH) or ".", exist_ok=True)
+    conn = sqlite3.connect(LLM_CACHE_PATH)
+    conn.execute("CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, value TEXT, expires_at REAL)")
+    return conn
+
+def _llm_cache_get(key: str) -> Optional[str]:
+    """Return the cached recommendation JSON for key, or None on a miss, an expired entry or a cache error"""
+    try:
+        with closing(_llm_cache_connect()) as conn:
+            row = conn.execute("SELECT value FROM llm_cache WHERE key = ? AND expires_at > ?", (key, time.time())).fetchone()
+        return row[0] if row else None
+    except (sqlite3.Error, OSError) as e:
+        logger.warning(f"LLM cache read failed: {e}")
+        return None
+
+def _llm_cache_set(key: str, value: str) -> None:
+    try:
+        with closing(_llm_cache_connect()) as conn, conn:  # second "conn" commits the write
+            conn.execute("INSERT OR REPLACE INTO llm_cache VALUES (?, ?, ?)", (key, value, time.time() + LLM_CACHE_TTL))
+    except (sqlite3.Error, OSError) as e:
+        logger.warning(f"LLM cache write failed: {e}")
+
 def get_llm_recommendation(context: str, state: AgentState) -> Recommendation:
     """Get ordering recommendation from LLM"""
     prompt = f"""
@@ -87,27 +129,18 @@ def get_llm_recommendation(context: str, state: AgentState) -> Recommendation:
     3. Supplier lead times and minimum order quantities
     4. Cost optimization
 
-    Respond ONLY with valid JSON in this format:
-    ```json
-    {{
-    "order_quantity": 300,
-    "supplier_name": "Atlanta Ice Cream Supplier",
-    "justification": "...",
-    "confidence_score": 0.0 - 1.0
-    }}
+    Give a confidence_score between 0.0 and 1.0.
     """
     
-    response = llm.invoke([HumanMessage(content=prompt)])
-    # print(f"LLM Response:\n{response.content}\n")
-
-    json_match = re.search(r'json\s*\n?({.*?})\s*\n?', response.content, re.DOTALL)
-    if json_match:
-        json_str = json_match.group(1)
-        recommendation_data = json.loads(json_str)
+    cache_key = _llm_cache_key(context, state.product_code)
+    cached = _llm_cache_get(cache_key)
+    if cached is not None:
+        logger.info("Supply Commander LLM cache hit")
+        decision = RecommendationDecision.model_validate_json(cached)
     else:
-        raise ValueError("No JSON found in LLM response")
-    
-    return Recommendation(
-        product_code=state.product_code,
-        **recommendation_data
-    )
\ No newline at end of file
+        decision = structured_llm.invoke([HumanMessage(content=prompt)])
+        # print(f"LLM Response:\n{decision}\n")
+        _llm_cache_set(cache_key, decision.model_dump_json())
+
+    # The product is known from the state, not something for the LLM to decide
+    return Recommendation(product_code=state.product_code, **decision.model_dump())
\ No newline at end of file
@@ -1,9 +1,13 @@
+from concurrent.futures import ThreadPoolExecutor
 from app.graph.state import AgentState
 from app.tools.weather_tools import get_weather_data_raw, get_average_demand_factor
 import logging
 
 logger = logging.getLogger(__name__)
 
+# The two weather lookups are independent, so they run side by side
+_TOOL_POOL = ThreadPoolExecutor(max_workers=2, thread_name_prefix="weather")
+
 def weather_agent(state: AgentState) -> AgentState:
     """
     Weather Agent: Fetches weather data and calculates demand impact.
@@ -13,20 +17,23 @@ def weather_agent(state: AgentState) -> AgentState:
     updates = {}
     
     try:
+        weather_future = _TOOL_POOL.submit(get_weather_data_raw.invoke, {"days": state.forecast_days})
+        factor_future = _TOOL_POOL.submit(get_average_demand_factor.invoke, {"days": state.forecast_days})
+
         # Get detailed weather data
-        weather_data = get_weather_data_raw.invoke({"days": state.forecast_days})
+        weather_data = weather_future.result()
         updates["weather_forecast"] = weather_data
         
         # Get average demand factor
-        avg_factor = get_average_demand_factor.invoke({"days": state.forecast_days})
+        avg_factor = factor_future.result()
         updates["average_demand_factor"] = avg_factor
         
         updates["current_step"] = "weather_analysis_complete"
-        updates["errors"] = state.errors
+        updates["errors"] = []  # No new errors; the state reducer keeps the existing ones
         
     except Exception as e:
         error_msg = f"Weather error: {str(e)}"
         logger.error(error_msg)
-        updates["errors"] = state.errors + [error_msg]
+        updates["errors"] = [error_msg]
     
     return updates  # state.model_copy(update=updates)
\ No newline at end of file
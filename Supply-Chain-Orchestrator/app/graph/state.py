@@ -1,6 +1,12 @@
-from typing import List, Dict, Optional, Any
+from typing import Annotated, List, Dict, Optional, Any
 from pydantic import BaseModel, Field
 from datetime import datetime
+import operator
+
+
+def _last_value(current: str, new: str) -> str:
+    """Reducer that keeps the latest write, so parallel nodes can both report their step"""
+    return new
 
 class ProductInfo(BaseModel):
     """Information about a specific product"""
@@ -48,6 +54,13 @@ class Recommendation(BaseModel):
     justification: str = Field(..., description="Reasoning behind the recommendation")
     confidence_score: float = Field(1.0, description="Confidence in recommendation (0.0-1.0)")
 
+class RecommendationDecision(BaseModel):
+    """Ordering decision as returned by the LLM; the product is added from the state, not decided by the LLM"""
+    supplier_name: str = Field(..., description="Recommended supplier")
+    order_quantity: int = Field(..., description="Units to order")
+    justification: str = Field(..., description="Reasoning behind the recommendation")
+    confidence_score: float = Field(..., description="Confidence in recommendation (0.0-1.0)")
+
 class AgentState(BaseModel):
     """
     The central state object that flows through the Meltaway supply chain workflow.
@@ -77,8 +90,10 @@ class AgentState(BaseModel):
     report_data: Dict[str, Any] = Field(default_factory=dict, description="Data for PDF report generation")
     
     # Metadata
-    current_step: str = Field("initialized", description="Current processing step")
-    errors: List[str] = Field(default_factory=list, description="Any errors encountered during processing")
+    # Reducers let the parallel data_analyst and weather nodes update these in the same step:
+    # agents return only their new errors, which are appended to the existing list
+    current_step: Annotated[str, _last_value] = Field("initialized", description="Current processing step")
+    errors: Annotated[List[str], operator.add] = Field(default_factory=list, description="Any errors encountered during processing")
     timestamp: str = Field(default_factory=lambda: datetime.now().isoformat(), description="Processing start time")
     
     class Config:
@@ -0,0 +1,86 @@
+import os
+import sqlite3
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+from app.graph.state import create_initial_state, RecommendationDecision
+from app.agents import supply_commander
+from app.agents.supply_commander import get_llm_recommendation
+
+class TestSupplyCommanderCache(unittest.TestCase):
+
+    def setUp(self):
+        """Give each test its own cache file and a mocked LLM"""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        cache_path = os.path.join(self.tmp_dir.name, "cache", "llm_cache.sqlite3")
+        self.patches = [
+            patch.object(supply_commander, "LLM_CACHE_PATH", cache_path),
+            patch.object(supply_commander, "structured_llm"),
+        ]
+        for p in self.patches:
+            p.start()
+            self.addCleanup(p.stop)
+        self.mock_llm = supply_commander.structured_llm
+        self.mock_llm.invoke.return_value = RecommendationDecision(
+            supplier_name="Supplier A", order_quantity=500, justification="Heatwave ahead", confidence_score=0.8
+        )
+        self.state = create_initial_state("vanilla", 8)
+        self.context = "PRODUCT: Vanilla Ice Cream\nCURRENT INVENTORY: 150 units"
+
+    def test_cache_hit_skips_the_llm(self):
+        first = get_llm_recommendation(self.context, self.state)
+        second = get_llm_recommendation(self.context, self.state)
+
+        self.mock_llm.invoke.assert_called_once()
+        self.assertEqual(first, second)
+        # product_code comes from the state, the rest from the LLM decision
+        self.assertEqual(second.product_code, "vanilla")
+        self.assertEqual(second.order_quantity, 500)
+        self.assertEqual(second.confidence_score, 0.8)
+        self.assertTrue(os.path.exists(supply_commander.LLM_CACHE_PATH))
+
+    def test_another_product_misses_even_with_the_same_context(self):
+        get_llm_recommendation(self.context, self.state)
+        other = get_llm_recommendation(self.context, create_initial_state("chocolate", 8))
+
+        self.assertEqual(self.mock_llm.invoke.call_count, 2)
+        self.assertEqual(other.product_code, "chocolate")
+
+    def test_different_context_misses(self):
+        get_llm_recommendation(self.context, self.state)
+        get_llm_recommendation(self.context + "\nWEATHER DEMAND FACTOR: 1.4x", self.state)
+
+        self.assertEqual(self.mock_llm.invoke.call_count, 2)
+
+    def test_expired_entry_calls_the_llm_again(self):
+        get_llm_recommendation(self.context, self.state)
+        # Just past the TTL
+        later = time.time() + supply_commander.LLM_CACHE_TTL + 1
+        with patch("app.agents.supply_commander.time.time", return_value=later):
+            get_llm_recommendation(self.context, self.state)
+            get_llm_recommendation(self.context, self.state)  # the refreshed entry is valid again
+
+        self.assertEqual(self.mock_llm.invoke.call_count, 2)
+
+    def test_sqlite_errors_fall_back_to_the_llm(self):
+        """An unusable cache must not fail the decision, only cost an LLM call"""
+        with patch("app.agents.supply_commander.sqlite3.connect", side_effect=sqlite3.OperationalError("disk I/O error")):
+            first = get_llm_recommendation(self.context, self.state)
+            second = get_llm_recommendation(self.context, self.state)
+
+        self.assertEqual(self.mock_llm.invoke.call_count, 2)
+        self.assertEqual(first, second)
+
+    def test_uncreatable_cache_directory_falls_back_to_the_llm(self):
+        blocker = os.path.join(self.tmp_dir.name, "not_a_dir")
+        open(blocker, "w").close()
+        with patch.object(supply_commander, "LLM_CACHE_PATH", os.path.join(blocker, "llm_cache.sqlite3")):
+            recommendation = get_llm_recommendation(self.context, self.state)
+
+        self.assertEqual(recommendation.supplier_name, "Supplier A")
+        self.mock_llm.invoke.assert_called_once()
+
+if __name__ == '__main__':
+    unittest.main()
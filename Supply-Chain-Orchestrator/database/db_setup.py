@@ -124,9 +124,10 @@ def visualize_seasonality(df):
     plt.close()
 
 
-def insert_sales_data(df):
+def insert_sales_data(df, conn=engine):
     try:
-        df.to_sql('sales', engine, if_exists='append', index=False, method='multi')
+        # Multi-row INSERTs of 1000 rows each: a handful of round-trips, with statements kept to a sane size
+        df.to_sql('sales', conn, if_exists='append', index=False, method='multi', chunksize=1000)
         print(f"✅ Inserted {len(df)} sales records.")
         visualize_seasonality(df)
     except Exception as e:
@@ -135,6 +136,9 @@ def insert_sales_data(df):
 
 
 def insert_sample_data():
+    sales_df = generate_sales_data()
+
+    # All tables are filled in one transaction: one commit, and no half-loaded database on failure
     with engine.begin() as conn:
         # 1. Products
         product_data = [
@@ -179,9 +183,8 @@ def insert_sample_data():
             ON CONFLICT (supplier_id, product_code) DO NOTHING;
         """), supplier_products_data)
 
-    # 5. Generate and insert sales
-    sales_df = generate_sales_data()
-    insert_sales_data(sales_df)
+        # 5. Sales, generated above
+        insert_sales_data(sales_df, conn)
 
     print("✅ Sample data inserted into all tables.")
 